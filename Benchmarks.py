@@ -0,0 +1,365 @@
+"""
+Benchmarks.py
+Benchmarks of the game engines: how fast each game generates moves, how long each searcher takes to choose a move at
+fixed depths, how the parallel searchers speed up with more workers, how much memory each state takes, and whether the
+full-depth searchers play Chopsticks perfectly (the run fails if not). Every benchmark is seeded, so two runs measure
+exactly the same work, and the results are written as JSON which a later run can be compared against to judge a change
+by its numbers:
+
+    python Benchmarks.py --output baseline.json
+    python Benchmarks.py --baseline baseline.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from ChopsticksGame import ChopsticksGame, PackedChopsticksGame
+from ChopsticksTablebase import solve, misplays
+from aima.games import (TicTacToe, ConnectFour, BitboardTicTacToe, BitboardConnectFour, Fig52Extended, SearchStats,
+                        minimax_decision, alphabeta_search, alphabeta_cutoff_search, iterative_deepening_search,
+                        monte_carlo_tree_search, parallel_alphabeta_search, parallel_monte_carlo_tree_search)
+
+infinity = float('inf')
+
+
+def fig52_extended(seed=0):
+    """
+    fig52_extended: Fig52Extended with its root as the initial state and random utilities on its leaves. Interior
+        states are valued 0, for the searchers which evaluate positions before reaching the leaves.
+    :param seed: The seed of the utilities.
+    :return game: The Fig52Extended game.
+    """
+    game = Fig52Extended()
+    rng = random.Random(seed)
+    game.initial = 0
+    game.utils = dict.fromkeys(range(13), 0)
+    game.utils.update((leaf, rng.randint(-10, 10)) for leaf in range(13, 40))
+    return game
+
+
+# The benchmarked games, by name: a function making the game, the depths its searchers are cut off at, the number of
+#   random plies played to reach the positions searched, and whether full-depth searches are quick enough to run:
+GAMES = {
+    'chopsticks-2x5': (lambda: ChopsticksGame(2, 5), (2, 4, 6), 0, True),
+    'packed-chopsticks-2x5': (lambda: PackedChopsticksGame(2, 5), (2, 4, 6), 0, True),
+    'packed-chopsticks-3x5-splits': (lambda: PackedChopsticksGame(3, 5, splits=True), (2, 4), 0, False),
+    'packed-chopsticks-4x4-folded': (lambda: PackedChopsticksGame(4, 4, fold_symmetries=True), (2, 4), 0, False),
+    'tictactoe': (TicTacToe, (2, 4), 2, True),
+    'bitboard-tictactoe': (BitboardTicTacToe, (2, 4), 2, True),
+    'connectfour': (ConnectFour, (2, 4), 4, False),
+    'bitboard-connectfour': (BitboardConnectFour, (2, 4), 4, False),
+    'fig52extended': (fig52_extended, (1, 2), 0, True),
+}
+
+
+def random_states(game, n, seed):
+    """
+    random_states: Collects states of a game by random play from its initial state, starting over whenever a game ends.
+    :param game: The game to play.
+    :param n: The number of (non-terminal) states to collect.
+    :param seed: The seed of the random play.
+    :return states: The states, in the order they were reached.
+    """
+    rng = random.Random(seed)
+    states = []
+    state = game.initial
+    while len(states) < n:
+        if game.terminal_test(state):
+            state = game.initial
+            continue
+        states.append(state)
+        state = game.result(state, rng.choice(game.actions(state)))
+    return states
+
+
+def best_time(function, repeats):
+    """
+    best_time: Times a function, taking the best of several runs so that interruptions by the rest of the system are
+        not counted.
+    :param function: The function to time, taking no arguments.
+    :param repeats: The number of runs.
+    :return seconds: The time taken by the quickest run.
+    """
+    best = infinity
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def benchmark_moves(game, states, repeats):
+    """
+    benchmark_moves: Measures how many calls of actions, result and result_unchecked the game makes per second.
+    :param game: The game to benchmark.
+    :param states: The states to generate moves in.
+    :param repeats: The number of timed runs.
+    :return results: The calls per second of each method.
+    """
+    moves = [(state, move) for state in states for move in game.actions(state)]
+
+    def actions():
+        for state in states:
+            game.actions(state)
+
+    def result():
+        for state, move in moves:
+            game.result(state, move)
+
+    def result_unchecked():
+        for state, move in moves:
+            game.result_unchecked(state, move)
+
+    return {'actions_per_sec': len(states) / best_time(actions, repeats),
+            'result_per_sec': len(moves) / best_time(result, repeats),
+            'result_unchecked_per_sec': len(moves) / best_time(result_unchecked, repeats)}
+
+
+def benchmark_memory(game, states):
+    """
+    benchmark_memory: Measures the memory taken by each state of a game, counting everything allocated by result to make
+        it except what is shared with its parent.
+    :param game: The game to benchmark.
+    :param states: The states whose children are made.
+    :return bytes_per_state: The average number of bytes allocated for and retained by each child state.
+    """
+    moves = [(state, game.actions(state)[0]) for state in states]
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    children = [game.result(state, move) for state, move in moves]
+    allocated = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    # The list holding the children is not part of them, and states which are small cached ints take no memory:
+    allocated -= sys.getsizeof(children)
+    return max(allocated, 0) / len(children)
+
+
+def searchers(depths, full_search):
+    """
+    searchers: Returns the searchers benchmarked on a game. Each takes the game, a state and an optional SearchStats,
+        which only the minimax and alpha-beta searchers fill in.
+    :param depths: The depths the cutoff searchers are cut off at.
+    :param full_search: Whether the full-depth searchers are included.
+    :return searchers: A dict of the searchers by name.
+    """
+    benchmarked = {}
+    if full_search:
+        benchmarked['minimax_decision'] = lambda game, state, stats=None: minimax_decision(state, game, stats=stats)
+        benchmarked['alphabeta_search'] = lambda game, state, stats=None: alphabeta_search(state, game, stats=stats)
+    for d in depths:
+        benchmarked['alphabeta_cutoff_search(d={})'.format(d)] = \
+            lambda game, state, stats=None, d=d: alphabeta_cutoff_search(state, game, d=d, stats=stats)
+        benchmarked['iterative_deepening_search(max_depth={})'.format(d)] = \
+            lambda game, state, stats=None, d=d: iterative_deepening_search(state, game, time_limit=infinity,
+                                                                            max_depth=d)
+    benchmarked['monte_carlo_tree_search(n_playouts=200)'] = \
+        lambda game, state, stats=None: monte_carlo_tree_search(state, game, n_playouts=200)
+    return benchmarked
+
+
+def benchmark_searchers(game, states, depths, full_search, repeats, seed):
+    """
+    benchmark_searchers: Measures how long each searcher takes to choose a move in each of the provided states, and how
+        many nodes it visits and moves it generates doing so when it can count them.
+    :param game: The game to benchmark.
+    :param states: The states to choose moves in.
+    :param depths: The depths the cutoff searchers are cut off at.
+    :param full_search: Whether the full-depth searchers are included.
+    :param repeats: The number of timed runs.
+    :param seed: The seed the random number generator is reset to before each search.
+    :return results: The seconds taken, and nodes visited and moves generated, by each searcher over all of the
+        states.
+    """
+    results = {}
+    for name, search in searchers(depths, full_search).items():
+        stats = SearchStats()
+        random.seed(seed)
+        for state in states:
+            search(game, state, stats)
+
+        def run():
+            random.seed(seed)
+            for state in states:
+                search(game, state)
+
+        seconds = best_time(run, repeats)
+        results[name] = {'seconds_per_move': seconds / len(states)}
+        if stats.nodes:
+            results[name]['nodes'] = stats.total_nodes
+            results[name]['nodes_per_sec'] = stats.total_nodes / seconds
+            results[name]['moves_generated'] = stats.moves
+    return results
+
+
+def worker_counts():
+    """
+    worker_counts: Returns the numbers of workers the parallel searchers are benchmarked with; each power of two up to
+        the number of CPUs, and the number of CPUs.
+    :return counts: The sorted numbers of workers.
+    """
+    cpus = os.cpu_count() or 1
+    return sorted({1 << i for i in range(cpus.bit_length()) if 1 << i <= cpus} | {cpus})
+
+
+def benchmark_parallel(game, states, full_search, repeats, seed, serial_results):
+    """
+    benchmark_parallel: Measures how long the parallel searchers take to choose a move in each of the provided states
+        with each number of workers (see worker_counts), and their speedup over the serial searcher they parallelize.
+        Each searcher's pool of workers is started by an untimed run, as it is kept for the searches after.
+    :param game: The game to benchmark.
+    :param states: The states to choose moves in.
+    :param full_search: Whether the full-depth parallel_alphabeta_search is included.
+    :param repeats: The number of timed runs.
+    :param seed: The seed the random number generator is reset to before each search.
+    :param serial_results: The results of benchmark_searchers on the same states, whose times the speedups are of.
+    :return results: The seconds taken and speedup of each parallel searcher over all of the states, by its number of
+        workers.
+    """
+    parallel = {'parallel_monte_carlo_tree_search(n_playouts=200)':
+                (lambda game, state, workers: parallel_monte_carlo_tree_search(state, game, workers, n_playouts=200),
+                 'monte_carlo_tree_search(n_playouts=200)')}
+    if full_search:
+        parallel['parallel_alphabeta_search'] = \
+            (lambda game, state, workers: parallel_alphabeta_search(state, game, workers), 'alphabeta_search')
+    results = {}
+    for name, (search, serial) in parallel.items():
+        results[name] = {}
+        for workers in worker_counts():
+
+            def run():
+                random.seed(seed)
+                for state in states:
+                    search(game, state, workers)
+
+            run()
+            seconds = best_time(run, repeats) / len(states)
+            results[name]['workers={}'.format(workers)] = {
+                'seconds_per_move': seconds, 'speedup': serial_results[serial]['seconds_per_move'] / seconds}
+    return results
+
+
+def benchmark_misplays(game):
+    """
+    benchmark_misplays: Checks the full-depth searchers, serial and parallel, against the perfect play of the tablebase
+        of a Chopsticks variant, in every position reachable in it; a searcher should never misplay.
+    :param game: The ChopsticksGame (packed or not) whose variant is checked.
+    :return results: The number of positions each full-depth searcher misplays in.
+    """
+    tablebase = solve(game)
+    full = {name: search for name, search in searchers((), full_search=True).items()
+            if name.startswith(('minimax', 'alphabeta'))}
+    full['parallel_alphabeta_search'] = lambda game, state: parallel_alphabeta_search(state, game, max(worker_counts()))
+    return {name: len(misplays(tablebase, lambda game, state, search=search: search(game, state)))
+            for name, search in full.items()}
+
+
+def run_benchmarks(games=None, seed=0, quick=False):
+    """
+    run_benchmarks: Runs every benchmark on the provided games.
+    :param games: The names of the games to benchmark (see GAMES); all of them by default.
+    :param seed: The seed of every random choice made.
+    :param quick: If True, fewer states are used and each benchmark is timed once, for a rough result in seconds.
+    :return results: The results, ready to be written as JSON.
+    """
+    num_states, num_search_states, repeats = (200, 1, 1) if quick else (5000, 3, 5)
+    results = {'meta': {'python': platform.python_version(), 'platform': platform.platform(), 'seed': seed,
+                        'quick': quick},
+               'games': {}}
+    for name in games or GAMES:
+        make_game, depths, opening_plies, full_search = GAMES[name]
+        game = make_game()
+        states = random_states(game, num_states, seed)
+        # Search from the initial state when no opening is played, and otherwise from the end of random openings:
+        search_states = [game.initial] if not opening_plies else \
+            [random_states(game, opening_plies + 1, seed + i)[-1] for i in range(num_search_states)]
+        result = benchmark_moves(game, states, repeats)
+        result['bytes_per_state'] = benchmark_memory(game, states)
+        result['search'] = benchmark_searchers(game, search_states, depths, full_search, repeats, seed)
+        result['parallel'] = benchmark_parallel(game, search_states, full_search, repeats, seed, result['search'])
+        if full_search and isinstance(game, ChopsticksGame):
+            result['misplays'] = benchmark_misplays(game)
+        results['games'][name] = result
+        print('{}: {:.0f} actions/s, {:.0f} results/s, {:.0f} bytes/state'.format(
+            name, result['actions_per_sec'], result['result_per_sec'], result['bytes_per_state']), file=sys.stderr)
+    return results
+
+
+def flatten(results, prefix=''):
+    """
+    flatten: Flattens the nested dicts of results into one dict of metrics, each named by its path through them.
+    :param results: The results of run_benchmarks, or a part of them.
+    :param prefix: The path to the provided results.
+    :return metrics: The numeric metrics, by path.
+    """
+    metrics = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            metrics.update(flatten(value, prefix + key + '/'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            metrics[prefix + key] = value
+    return metrics
+
+
+def compare(results, baseline, tolerance=0.1):
+    """
+    compare: Compares results against a baseline. Rates (metrics ending in _per_sec) and speedups should be higher, and
+        everything else (times, memory and node counts) lower; a metric is a regression if it is worse by more than
+        tolerance.
+    :param results: The results of run_benchmarks.
+    :param baseline: The results of an earlier run_benchmarks to compare against.
+    :param tolerance: The fraction by which a metric may be worse before it is reported as a regression.
+    :return comparison: A list of (metric, baseline value, value, ratio, regressed) for each metric in both, where
+        ratio is above 1 when the metric improved.
+    """
+    current, previous = flatten(results['games']), flatten(baseline['games'])
+    comparison = []
+    for metric in sorted(current.keys() & previous.keys()):
+        old, new = previous[metric], current[metric]
+        if not old or not new:
+            continue
+        ratio = new / old if metric.endswith(('_per_sec', '/speedup')) else old / new
+        comparison.append((metric, old, new, ratio, ratio < 1 - tolerance))
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the game engines.')
+    parser.add_argument('--games', nargs='+', choices=sorted(GAMES), help='the games to benchmark (default: all)')
+    parser.add_argument('--seed', type=int, default=0, help='the seed of every random choice (default: 0)')
+    parser.add_argument('--quick', action='store_true', help='a rough, fast run')
+    parser.add_argument('--output', help='the file to write the results to as JSON (default: standard output)')
+    parser.add_argument('--baseline', help='a file of earlier results to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='the fraction by which a metric may be worse than the baseline (default: 0.1)')
+    args = parser.parse_args()
+    results = run_benchmarks(games=args.games, seed=args.seed, quick=args.quick)
+    misplayed = ['{}/{}: {}'.format(game, name, count) for game, result in results['games'].items()
+                 for name, count in result.get('misplays', {}).items() if count]
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    elif not args.baseline:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        comparison = compare(results, baseline, args.tolerance)
+        for metric, old, new, ratio, regressed in comparison:
+            print('{:<90} {:>14.6g} {:>14.6g} {:>7.2f}x{}'.format(metric, old, new, ratio,
+                                                                  '  REGRESSION' if regressed else ''))
+        # Fail, e.g. a CI job, when anything has regressed:
+        if any(regressed for *_, regressed in comparison):
+            sys.exit(1)
+    # A searcher which no longer plays perfectly is a regression whatever the baseline:
+    if misplayed:
+        print('Positions misplayed by full-depth searchers:', ', '.join(misplayed), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""
+ChopsticksBatch.py
+Vectorized evaluation of many ChopsticksGame positions at once with NumPy, for scoring logged positions in bulk rather
+than one Python call per position. A batch of N positions is an (N, 2, num_hands) array of boards, the human's hands in
+row 0 and the cpu's in row 1 as in ChopsticksGame's board dicts, and a vector saying who is to move in each.
+
+Requires NumPy, which the rest of the game does not.
+"""
+from collections import namedtuple
+import numpy as np
+
+# The evaluation of a batch of N positions over the M moves of batch_moves:
+#   terminal: (N,) bool; whether either player has no fingers left.
+#   utility: (N,) int8; the utility of each position to the player to move.
+#   legal: (N, M) bool; whether each move is allowed (see ChopsticksGame.actions); none are in terminal positions.
+#   successors: (N, M, 2, num_hands); the board each move leads to, or the board itself where the move is not legal.
+BatchEvaluation = namedtuple('BatchEvaluation', 'terminal, utility, legal, successors')
+
+
+def batch_moves(game):
+    """
+    batch_moves: Returns every move of the game's variant, in the order of the columns of a BatchEvaluation; every
+        (from_hand, to_hand) strike, followed by every (from_hand, to_hand, num_fingers) transfer if splits are allowed.
+    :param game: The ChopsticksGame (packed or not).
+    :return moves: The list of moves.
+    """
+    hands = range(game.num_hands)
+    moves = [(from_hand, to_hand) for from_hand in hands for to_hand in hands]
+    if game.splits:
+        moves += [(from_hand, to_hand, num_fingers) for from_hand in hands for to_hand in hands if from_hand != to_hand
+                  for num_fingers in range(1, game.num_fingers)]
+    return moves
+
+
+def unpack_states(game, states):
+    """
+    unpack_states: Converts packed states (see ChopsticksGame.encode) to a batch of boards.
+    :param game: The ChopsticksGame (packed or not).
+    :param states: A sequence of N packed states.
+    :return (boards, human_to_move): The (N, 2, num_hands) array of boards and the (N,) bool array of whether the
+        human is to move.
+    """
+    states = np.asarray(states, dtype=np.int64)
+    places = np.array([game.human_places, game.cpu_places], dtype=np.int64)
+    boards = (states[:, None, None] >> 1) // places % game.num_fingers
+    return boards.astype(np.int8), (states & 1).astype(bool)
+
+
+def pack_boards(game, boards, human_to_move):
+    """
+    pack_boards: Converts a batch of boards to packed states (see ChopsticksGame.encode).
+    :param game: The ChopsticksGame (packed or not).
+    :param boards: An (N, 2, num_hands) array of boards.
+    :param human_to_move: An (N,) array of whether the human is to move.
+    :return states: The (N,) int64 array of packed states.
+    """
+    places = np.array([game.human_places, game.cpu_places], dtype=np.int64)
+    board = (np.asarray(boards, dtype=np.int64) * places).sum(axis=(1, 2))
+    return (board << 1) | np.asarray(human_to_move, dtype=np.int64)
+
+
+def first_of_value(hands, hand):
+    """
+    first_of_value: Returns whether a hand is the first of a player's hands holding its number of fingers; when folding
+        symmetries only those hands take part in strikes (see ChopsticksGame.distinct_moves).
+    :param hands: An (N, num_hands) array of the hands of one player in each position.
+    :param hand: The index of the hand.
+    :return first: The (N,) bool array.
+    """
+    return ~(hands[:, :hand] == hands[:, hand:hand + 1]).any(axis=1)
+
+
+def evaluate_batch(game, boards, to_move):
+    """
+    evaluate_batch: Evaluates a batch of positions in one vectorized pass, giving for each what terminal_test, utility,
+        actions and result give for a single position of the game.
+    :param game: The ChopsticksGame (packed or not) whose rules apply.
+    :param boards: An (N, 2, num_hands) integer array of boards; the human's hands in row 0 and the cpu's in row 1, each
+        holding 0 to num_fingers - 1 fingers.
+    :param to_move: An (N,) array of who is to move in each position; 'h' or 'c', or true where the human is to move.
+    :return evaluation: The BatchEvaluation of the positions.
+    """
+    boards = np.asarray(boards)
+    num_hands = game.num_hands
+    if boards.ndim != 3 or boards.shape[1:] != (2, num_hands):
+        raise ValueError('Expected boards of shape (N, 2, {}); got {}'.format(num_hands, boards.shape))
+    if ((boards < 0) | (boards >= game.num_fingers)).any():
+        raise ValueError('Expected boards of 0 to {} fingers per hand; got {} to {}'.format(
+            game.num_fingers - 1, boards.min(), boards.max()))
+    to_move = np.asarray(to_move)
+    human_to_move = to_move == 'h' if to_move.dtype.kind in 'USO' else to_move.astype(bool)
+    if human_to_move.shape != boards.shape[:1]:
+        raise ValueError('Expected to_move of shape {}; got {}'.format(boards.shape[:1], to_move.shape))
+    rows = np.arange(len(boards))
+    # The row of the board of the player to move, and of their opponent:
+    mover = np.where(human_to_move, 0, 1)
+    opponent = 1 - mover
+    own, other = boards[rows, mover], boards[rows, opponent]
+    human_out, cpu_out = ~boards[:, 0].any(axis=1), ~boards[:, 1].any(axis=1)
+    terminal = human_out | cpu_out
+    # As in ChopsticksGame.utility, the human losing takes precedence should both players be out of fingers:
+    human_utility = np.where(human_out, -1, np.where(cpu_out, 1, 0)).astype(np.int8)
+    utility = np.where(human_to_move, human_utility, -human_utility)
+    moves = batch_moves(game)
+    legal = np.zeros((len(boards), len(moves)), dtype=bool)
+    successors = np.repeat(boards[:, None], len(moves), axis=1)
+    # The fingers left on a struck hand, indexed by the sum of the fingers of the striking and struck hands:
+    attack_fingers = np.array(game.attack_fingers, dtype=boards.dtype)
+    sorted_own = np.sort(own, axis=1)
+    transferred = []  # The sorted hands left by each transfer so far, and where it was legal, when folding symmetries
+    for column, move in enumerate(moves):
+        if len(move) == 2:
+            from_hand, to_hand = move
+            allowed = ~terminal & (own[:, from_hand] > 0) & (other[:, to_hand] > 0)
+            struck = attack_fingers[own[:, from_hand] + other[:, to_hand]]
+            if game.fold_symmetries:
+                allowed &= first_of_value(own, from_hand) & first_of_value(other, to_hand)
+                # Without rollover hands of different numbers of fingers can put the same hand out, and only the first
+                #   strike doing so is kept:
+                put_out_before = (attack_fingers[own[:, :from_hand] + other[:, to_hand:to_hand + 1]] == 0).any(axis=1)
+                allowed &= (struck > 0) | ~put_out_before
+            successors[rows, column, opponent, to_hand] = np.where(allowed, struck, other[:, to_hand])
+        else:
+            from_hand, to_hand, num_fingers = move
+            hands = own.copy()
+            hands[:, from_hand] -= num_fingers
+            hands[:, to_hand] += num_fingers
+            sorted_hands = np.sort(hands, axis=1)
+            # A transfer may not overfill a hand, and must do more than swap the hands:
+            allowed = (~terminal & (own[:, from_hand] >= num_fingers) & (hands[:, to_hand] < game.num_fingers)
+                       & (sorted_hands != sorted_own).any(axis=1))
+            if game.fold_symmetries:
+                for earlier_hands, earlier_allowed in transferred:
+                    allowed &= ~(earlier_allowed & (earlier_hands == sorted_hands).all(axis=1))
+                transferred.append((sorted_hands, allowed))
+            successors[rows, column, mover] = np.where(allowed[:, None], hands, own)
+        legal[:, column] = allowed
+    return BatchEvaluation(terminal, utility, legal, successors)
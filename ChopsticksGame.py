@@ -7,6 +7,7 @@ from aima.utils import *
 from aima.games import Game
 from aima.games import GameState
 from copy import deepcopy
+from itertools import combinations_with_replacement
 
 __author__ = "Chris Campell"
 __version__ = "10/3/2017"
@@ -17,24 +18,310 @@ class ChopsticksGame(Game):
     TODO: class header.
     """
     initial = None
+    # Hands wrap around, so positions can recur during a game:
+    cyclic = True
 
-    def __init__(self, num_hands=2, num_fingers=5):
+    def __init__(self, num_hands=2, num_fingers=5, fold_symmetries=False, splits=False, rollover=True):
+        """
+        :param num_hands: The number of hands the players have.
+        :param num_fingers: The number of fingers the players have on each hand.
+        :param fold_symmetries: If True, positions which differ only in the order of a player's hands are treated as
+            one; actions offers a single move for each distinct resulting position and state_key identifies positions
+            by their canonical form (see canonical_key).
+        :param splits: If True, a player may instead move fingers between their own hands (a split, or transfer) of
+            the form (from_hand, to_hand, num_fingers), reviving hands which are out; see compute_transfers.
+        :param rollover: If True, a hand struck up to num_fingers or more keeps only the remainder (the rollover rule);
+            otherwise it is out (the cutoff rule).
+        """
         # self.initial = {'human': (1,1), 'cpu':(1,1), 'turn': 'h'}
         self.num_hands = num_hands
         self.num_fingers = num_fingers
+        self.fold_symmetries = fold_symmetries
+        self.splits = splits
+        self.rollover = rollover
+        # Everything which determines the positions of the game and how they are keyed, in the order of the arguments:
+        self.variant = (num_hands, num_fingers, fold_symmetries, splits, rollover)
+        # The fingers left on a struck hand, indexed by the sum of the fingers of the striking and struck hands:
+        self.attack_fingers = tuple(fingers % num_fingers if rollover else fingers if fingers < num_fingers else 0
+                                    for fingers in range(2 * num_fingers - 1))
         # Every move is possible starting out; takes the form (from_hand, to_opponents_hand) indexed L=0, R=1:
         moves = [(from_hand, to_hand) for from_hand in range(0, num_hands) for to_hand in range(0, num_hands)]
         human_hands = tuple(1 for i in range(num_hands))
         cpu_hands = tuple(1 for i in range(num_hands))
         self.initial = GameState(to_move='c', utility=0, board={'human': human_hands, 'cpu': cpu_hands}, moves=moves)
+        # Place values used to pack a board into a single int; each hand is one base-num_fingers digit, the human's
+        #   hands occupying the low digits and the cpu's hands the high digits:
+        self.human_places = tuple(num_fingers ** hand for hand in range(num_hands))
+        self.cpu_places = tuple(num_fingers ** (num_hands + hand) for hand in range(num_hands))
+        # The initial state carries its packed encoding as its key, as do all of the states made by result:
+        self.initial = self.initial._replace(key=self.encode(self.initial))
+        # The number of distinct boards of a single player, and the number of distinct packed states overall:
+        self.side_size = num_fingers ** num_hands
+        self.num_packed_states = 2 * self.side_size * self.side_size
+        # Hand order does not matter, so the canonical form of a player's hands is sorted. side_canonical maps each
+        #   packed board of a single player to its canonical form, and side_rank to the index of that form among all
+        #   of the canonical forms:
+        canonical_sides = [sum(place * fingers for place, fingers in zip(self.human_places, hands))
+                           for hands in combinations_with_replacement(range(num_fingers), num_hands)]
+        ranks = {side: rank for rank, side in enumerate(canonical_sides)}
+        self.side_canonical = [canonical_sides[0]] * self.side_size
+        self.side_rank = [0] * self.side_size
+        for side in range(self.side_size):
+            hands = sorted(side // place % num_fingers for place in self.human_places)
+            self.side_canonical[side] = sum(place * fingers for place, fingers in zip(self.human_places, hands))
+            self.side_rank[side] = ranks[self.side_canonical[side]]
+        self.num_canonical_sides = len(canonical_sides)
+        self.num_canonical_states = 2 * self.num_canonical_sides * self.num_canonical_sides
+        # The number of distinct keys state_key can return:
+        self.num_state_keys = self.num_canonical_states if fold_symmetries else self.num_packed_states
+        # Move generation tables, indexed like side_canonical by the packed board of a single player: the fingers on
+        #   each hand, the hands which can strike or be struck (only the first holding each number of fingers when
+        #   folding symmetries, see distinct_moves), and the transfers available (see actions):
+        self.side_fingers = [tuple(side // place % num_fingers for place in self.human_places)
+                             for side in range(self.side_size)]
+        self.side_hands = [tuple(hand for hand, fingers in enumerate(hands)
+                                 if fingers and (not fold_symmetries or hands.index(fingers) == hand))
+                           for hands in self.side_fingers]
+        self.side_transfers = [tuple(self.distinct_moves(self.compute_transfers(hands), hands, hands)
+                                     if fold_symmetries else self.compute_transfers(hands)) if splits else ()
+                               for hands in self.side_fingers]
+        # Every (from_hand, to_hand) move, shared between calls to actions so that no move tuples are re-allocated:
+        self.all_moves = tuple(tuple((from_hand, to_hand) for to_hand in range(num_hands))
+                               for from_hand in range(num_hands))
+
+    def encode(self, state):
+        """
+        encode: Packs the provided GameState into a single int. The board occupies the high bits as base-num_fingers
+            digits (see human_places and cpu_places) and the lowest bit is set when it is the human's turn to move.
+        :param state: The GameState to pack.
+        :return packed_state: The int encoding of the provided GameState.
+        """
+        board = 0
+        for place, num_fingers in zip(self.human_places, state.board['human']):
+            board += place * num_fingers
+        for place, num_fingers in zip(self.cpu_places, state.board['cpu']):
+            board += place * num_fingers
+        return (board << 1) | (1 if state.to_move == 'h' else 0)
+
+    def packed_result(self, state, move):
+        """
+        packed_result: Makes a move in a packed state (see encode) by arithmetic on its digits. Every GameState made by
+            result carries its packed encoding as its key this way, so state_key takes constant time. The move is not
+            validated.
+        :param state: The initial packed state.
+        :param move: A legal move in the initial state of the form: (from_hand, to_hand) or a transfer
+        :return resultant_state: The packed state resulting from the given move.
+        """
+        board = state >> 1
+        if state & 1:
+            from_places, to_places = self.human_places, self.cpu_places
+        else:
+            from_places, to_places = self.cpu_places, self.human_places
+        if len(move) == 3:
+            # Move the fingers between the digits of the two hands:
+            from_hand, to_hand, num_fingers = move
+            board += (from_places[to_hand] - from_places[from_hand]) * num_fingers
+        else:
+            # Replace the digit of the attacked hand:
+            num_fingers = self.num_fingers
+            to_place = to_places[move[1]]
+            to_fingers = board // to_place % num_fingers
+            board += (self.attack_fingers[board // from_places[move[0]] % num_fingers + to_fingers]
+                      - to_fingers) * to_place
+        # Hand the turn to the other player:
+        return (board << 1) | (~state & 1)
+
+    def canonical_packed(self, packed_state):
+        """
+        canonical_packed: Returns the canonical form of a packed state; the same position with each player's hands
+            sorted in increasing order of fingers.
+        :param packed_state: The int encoding of a GameState.
+        :return canonical_state: The int encoding of the canonical form of the provided state.
+        """
+        board = packed_state >> 1
+        human_side = self.side_canonical[board % self.side_size]
+        cpu_side = self.side_canonical[board // self.side_size]
+        return ((cpu_side * self.side_size + human_side) << 1) | (packed_state & 1)
+
+    def canonical_key(self, packed_state):
+        """
+        canonical_key: Returns a dense index for the canonical form of a packed state, in range(num_canonical_states).
+            Two states have the same canonical key exactly when they differ only in the order of the players' hands.
+        :param packed_state: The int encoding of a GameState.
+        :return key: The index of the canonical form of the provided state.
+        """
+        board = packed_state >> 1
+        cpu_rank = self.side_rank[board // self.side_size]
+        human_rank = self.side_rank[board % self.side_size]
+        return ((cpu_rank * self.num_canonical_sides + human_rank) << 1) | (packed_state & 1)
+
+    def canonical(self, state):
+        """
+        canonical: Returns the canonical form of the provided GameState (see canonical_packed).
+        :param state: The GameState to canonicalize.
+        :return canonical_state: The GameState with each player's hands sorted.
+        """
+        return self.decode(self.canonical_packed(self.encode(state)))
+
+    def state_key(self, state):
+        """
+        state_key: Returns a hashable key identifying the provided GameState; its packed int encoding, or its
+            canonical_key if symmetries are folded.
+        :param state: The GameState to identify.
+        :return key: The int key of the provided GameState.
+        """
+        key = self.packed_key(state)
+        return self.canonical_key(key) if self.fold_symmetries else key
+
+    def packed_key(self, state):
+        """
+        packed_key: Returns the packed encoding of the provided GameState in constant time; the key it carries, or
+            else (for states not made by result or decode) its encoding.
+        :param state: The GameState to identify.
+        :return packed_state: The int encoding of the provided GameState.
+        """
+        return state.key if state.key is not None else self.encode(state)
+
+    def sides(self, state):
+        """
+        sides: Splits the board of a packed state into the packed boards of each player (see side_fingers).
+        :param state: The packed state of the game.
+        :return (from_side, to_side): The boards of the player to move and of the opponent.
+        """
+        board = state >> 1
+        if state & 1:
+            return board % self.side_size, board // self.side_size
+        return board // self.side_size, board % self.side_size
+
+    def staged_moves(self, from_side, to_side):
+        """
+        staged_moves: Generates the allowable moves read off the move generation tables in stages, most promising
+            first: strikes which put one of the opponent's hands out, then the other strikes, then any transfers. Each
+            stage is only generated once the moves before it have been drawn, so moves never reached are never made.
+        :param from_side: The packed board of the player to move (see sides).
+        :param to_side: The packed board of the opponent.
+        :return moves: A generator of the moves of actions, in staged order.
+        """
+        all_moves, attack_fingers = self.all_moves, self.attack_fingers
+        from_fingers, to_fingers = self.side_fingers[from_side], self.side_fingers[to_side]
+        from_hands, to_hands = self.side_hands[from_side], self.side_hands[to_side]
+        if self.fold_symmetries:
+            # Every strike putting the same hand out leaves the same position, so only the first is made:
+            for to_hand in to_hands:
+                for from_hand in from_hands:
+                    if not attack_fingers[from_fingers[from_hand] + to_fingers[to_hand]]:
+                        yield all_moves[from_hand][to_hand]
+                        break
+        else:
+            for from_hand in from_hands:
+                for to_hand in to_hands:
+                    if not attack_fingers[from_fingers[from_hand] + to_fingers[to_hand]]:
+                        yield all_moves[from_hand][to_hand]
+        for from_hand in from_hands:
+            for to_hand in to_hands:
+                if attack_fingers[from_fingers[from_hand] + to_fingers[to_hand]]:
+                    yield all_moves[from_hand][to_hand]
+        yield from self.side_transfers[from_side]
+
+    def distinct_moves(self, moves, from_hands, to_hands):
+        """
+        distinct_moves: Filters a list of moves down to one move for each distinct resulting position, up to the order
+            of the hands. Hands holding the same number of fingers are interchangeable, so only strikes from the first
+            of them and to the first of them are kept, and the first transfer leading to each sorted set of hands.
+            Without rollover, hands of different numbers of fingers can put the same hand out, so only the first
+            strike putting each hand out is kept; with it, each leaves the struck hand a different number of fingers.
+        :param moves: The moves, of the form (from_hand, to_hand) or (from_hand, to_hand, num_fingers), to filter.
+        :param from_hands: The hands of the player to move.
+        :param to_hands: The hands of the opponent.
+        :return moves: The moves leading to distinct positions.
+        """
+        distinct = []
+        transferred = set()
+        struck_out = set()  # The hands already put out by a strike kept
+        for move in moves:
+            if len(move) == 3:
+                hands = tuple(sorted(self.transfer_hands(from_hands, move)))
+                if hands not in transferred:
+                    transferred.add(hands)
+                    distinct.append(move)
+            elif from_hands.index(from_hands[move[0]]) == move[0] and to_hands.index(to_hands[move[1]]) == move[1]:
+                if not self.attack_fingers[from_hands[move[0]] + to_hands[move[1]]]:
+                    if move[1] in struck_out:
+                        continue
+                    struck_out.add(move[1])
+                distinct.append(move)
+        return distinct
+
+    def transfer_hands(self, hands, move):
+        """
+        transfer_hands: Applies a transfer to the hands of the player making it.
+        :param hands: The hands of the player making the transfer.
+        :param move: The transfer, of the form (from_hand, to_hand, num_fingers).
+        :return hands: The hands after the transfer.
+        """
+        from_hand, to_hand, num_fingers = move
+        hands = list(hands)
+        hands[from_hand] -= num_fingers
+        hands[to_hand] += num_fingers
+        return tuple(hands)
+
+    def compute_transfers(self, hands):
+        """
+        compute_transfers: Returns every transfer available to a player with the provided hands. Any number of fingers
+            may be moved from one hand to another, so long as no hand ends up with num_fingers or more and the hands
+            are not merely swapped; the player's hands must end up different, up to their order.
+        :param hands: The hands of the player to move.
+        :return transfers: A list of transfers of the form (from_hand, to_hand, num_fingers).
+        """
+        transfers = []
+        sorted_hands = sorted(hands)
+        for from_hand, from_fingers in enumerate(hands):
+            for to_hand, to_fingers in enumerate(hands):
+                if from_hand == to_hand:
+                    continue
+                for num_fingers in range(1, min(from_fingers, self.num_fingers - 1 - to_fingers) + 1):
+                    move = (from_hand, to_hand, num_fingers)
+                    if sorted(self.transfer_hands(hands, move)) != sorted_hands:
+                        transfers.append(move)
+        return transfers
+
+    def decode(self, packed_state):
+        """
+        decode: Unpacks an int produced by encode back into the equivalent GameState.
+        :param packed_state: The int encoding of a GameState.
+        :return state: The equivalent GameState, complete with utility and allowable moves.
+        """
+        board = packed_state >> 1
+        game_board = {'human': tuple(board // place % self.num_fingers for place in self.human_places),
+                      'cpu': tuple(board // place % self.num_fingers for place in self.cpu_places)}
+        to_move = 'h' if packed_state & 1 else 'c'
+        # The cached utility is always from the perspective of the player who made the last move:
+        utility = self.compute_utility(game_board=game_board, move=None, player='c' if to_move == 'h' else 'h')
+        return GameState(to_move=to_move, utility=utility, board=game_board,
+                         moves=self.compute_moves(player=to_move, game_board=game_board), key=packed_state)
 
     def actions(self, state):
         """
         actions: Returns a list of allowable moves given the current state.
         :param state: The state of the game.
-        :return possible_actions: A list of performable actions of the form (from_hand: L or R, to_hand: L or R).
+        :return possible_actions: A list of performable actions of the form (from_hand, to_hand), and when splits are
+            allowed (from_hand, to_hand, num_fingers).
+        """
+        moves = self.compute_moves(player=state.to_move, game_board=state.board)
+        if self.fold_symmetries:
+            if state.to_move == 'h':
+                return self.distinct_moves(moves, state.board['human'], state.board['cpu'])
+            return self.distinct_moves(moves, state.board['cpu'], state.board['human'])
+        return moves
+
+    def iter_actions(self, state):
+        """
+        iter_actions: Generates the allowable moves of the provided state lazily and in stages (see staged_moves), for
+            the searchers to draw from until they cut the state off.
+        :param state: The state of the game.
+        :return possible_actions: A generator of the moves of actions, most promising first.
         """
-        return self.compute_moves(player=state.to_move, game_board=state.board)
+        return self.staged_moves(*self.sides(self.packed_key(state)))
 
     def update_game_board(self, state, move):
         """
@@ -44,38 +331,19 @@ class ChopsticksGame(Game):
         :param move: The move to apply to the GameState.
         :return resultant_game_board: The resultant state of the gameboard after applying the given move.
         """
-        resultant_game_board = {'human': None, 'cpu': None}
-        # Update the board:
-        from_hand = move[0]
-        to_hand = move[1]
         if state.to_move == 'h':
-            # It is the human's turn to move:
-            # Update the finger count on the appropriate hand:
-            cpu_updated_to_hand = ((state.board['cpu'][to_hand]
-                                    + state.board['human'][from_hand]) % 5)
-            # Tuples are immutable so we need a temporary list to modify.
-            temp_cpu_hand = list(state.board['cpu'])
-            # Iterate through each hand and update the appropriate one:
-            for hand, num_fingers in enumerate(temp_cpu_hand):
-                if hand == to_hand:
-                    temp_cpu_hand[hand] = cpu_updated_to_hand
-            # Now that the appropriate hand has been updated, type cast back to a tuple and we are done:
-            resultant_game_board['cpu'] = tuple(temp_cpu_hand)
-            resultant_game_board['human'] = tuple(state.board['human'])
+            attacker, defender = 'human', 'cpu'
         else:
-            # It is the computer's turn to move:
-            # Update the finger count on the appropriate hand:
-            human_updated_to_hand = ((state.board['human'][to_hand]
-                                      + state.board['cpu'][from_hand]) % 5)
-            # Tuples are immutable so we need a temporary list to modify.
-            temp_human_hand = list(state.board['human'])
-            # Iterate through each hand and update the appropriate one:
-            for hand, num_fingers in enumerate(temp_human_hand):
-                if hand == to_hand:
-                    temp_human_hand[hand] = human_updated_to_hand
-            # Now that the appropriate hand has been updated, type cast back to a tuple and we are done:
-            resultant_game_board['human'] = tuple(temp_human_hand)
-            resultant_game_board['cpu'] = tuple(state.board['cpu'])
+            attacker, defender = 'cpu', 'human'
+        resultant_game_board = dict(state.board)
+        if len(move) == 3:
+            resultant_game_board[attacker] = self.transfer_hands(state.board[attacker], move)
+            return resultant_game_board
+        # Only the attacked hand changes; the other hands are shared with the initial gameboard:
+        from_hand, to_hand = move
+        hands = state.board[defender]
+        updated_fingers = self.attack_fingers[hands[to_hand] + state.board[attacker][from_hand]]
+        resultant_game_board[defender] = hands[:to_hand] + (updated_fingers,) + hands[to_hand + 1:]
         return resultant_game_board
 
     def compute_utility(self, game_board, move, player):
@@ -120,7 +388,7 @@ class ChopsticksGame(Game):
             to be constructed pending this method's execution.
         :param player: The player for whom possible moves should be computed.
         :param game_board: The gameboard from which possible moves should be computed.
-        :return moves: A list of performable actions of the form (from_hand: L or R, to_hand: L or R).
+        :return moves: A list of performable actions of the form (from_hand, to_hand), followed by any transfers.
         """
         moves = []
         if player == 'h':
@@ -143,64 +411,54 @@ class ChopsticksGame(Game):
                     if cpu_num_fingers > 0 and human_num_fingers > 0:
                         # You can only execute a move if your hand is not out and your opponent's  hand is not out.
                         moves.append((from_hand, to_hand))
+        if self.splits:
+            moves += self.compute_transfers(game_board['human'] if player == 'h' else game_board['cpu'])
         return moves
 
     def result(self, state, move):
         """
         result: Returns the state that results from making a move in the provided state.
         :param state: The initial state.
-        :param move: The move performed in the initial state of the form: (from_hand, to_hand)
+        :param move: The move performed in the initial state of the form: (from_hand, to_hand) or a transfer
         :return resultant_state: The GameState resulting from the given move.
         """
         # Check to see if the move is invalid (e.g. human player input incapable move)
         if move not in self.compute_moves(player=state.to_move,game_board=state.board):
             # An invalid move results in no change to the game state:
             return state
-        # Update the to_move field appropriately:
         # After this function is done executing, it will be the other players turn:
-        updated_to_move = None
-        if state.to_move == 'h':
-            updated_to_move = 'c'
-        else:
-            updated_to_move = 'h'
+        updated_to_move = 'c' if state.to_move == 'h' else 'h'
         # Update the gameboard appropriately:
         updated_board = self.update_game_board(state=state, move=move)
         # Update the utility using the new board obtained by the specified move according to player who executed it:
         updated_utility = self.compute_utility(game_board=updated_board, move=move, player=state.to_move)
         # Determine which moves are possible in the new state from the new players perspective:
         updated_moves = self.compute_moves(player=updated_to_move, game_board=updated_board)
-        # Construct a new GameState using all updated state information and return it to the method invoker:
-        resultant_state = GameState(to_move=updated_to_move, utility=updated_utility,
-                                         board=updated_board, moves=updated_moves)
-        return resultant_state
+        return GameState(to_move=updated_to_move, utility=updated_utility, board=updated_board, moves=updated_moves,
+                         key=self.packed_result(self.packed_key(state), move))
+
+    def result_unchecked(self, state, move):
+        """
+        result_unchecked: The fast path of result for the searchers, whose moves always come from actions. The move is
+            not validated, and the utility and moves of the resultant state are left as None rather than computed;
+            utility(), terminal_test() and actions() work from the board alone.
+        :param state: The initial state.
+        :param move: A legal move in the initial state of the form: (from_hand, to_hand) or a transfer
+        :return resultant_state: The GameState resulting from the given move, without its utility and moves.
+        """
+        return GameState(to_move='c' if state.to_move == 'h' else 'h', utility=None,
+                         board=self.update_game_board(state=state, move=move), moves=None,
+                         key=self.packed_result(self.packed_key(state), move))
 
     def utility(self, state, player):
         """
-        utility: The value of the final state which is returned to the player.
-        :param state:
-        :param player:
-        :return:
+        utility: The value of the final state which is returned to the player; 1 if the opponent has no fingers left,
+            -1 if the player has no fingers left, and 0 otherwise.
+        :param state: The state of the game.
+        :param player: The player ('h' or 'c') for whom the utility is computed.
+        :return utility: The utility of the state as viewed from the perspective of the provided player.
         """
-        if state.to_move == 'h' and player == 'h':
-            if state.board['cpu'] == (0, 0) or state.board['cpu'] == (0,0,0):
-                return 1
-            else:
-                return 0
-        elif state.to_move == 'c' and player == 'h':
-            if state.board['human'] == (0, 0) or state.board['human'] == (0, 0, 0):
-                return -1
-            else:
-                return 0
-        elif state.to_move == 'h' and player == 'c':
-            if state.board['cpu'] == (0, 0) or state.board['cpu'] == (0, 0, 0):
-                return -1
-            else:
-                return 0
-        elif state.to_move == 'c' and player == 'c':
-            if state.board['human'] == (0, 0) or state.board['human'] == (0, 0, 0):
-                return 1
-            else:
-                return 0
+        return self.compute_utility(game_board=state.board, move=None, player=player)
 
     def terminal_test(self, state):
         """
@@ -225,21 +483,143 @@ class ChopsticksGame(Game):
 
     def display(self, state):
         if isinstance(state, GameState):
-            human_readable_moves = []
-            for i, j in state.moves:
-                from_hand = None
-                to_hand = None
-                if i == 0:
-                    from_hand = 'L'
-                else:
-                    from_hand = 'R'
-                if j == 0:
-                    to_hand = 'L'
-                else:
-                    to_hand = 'R'
-                human_readable_moves.append((from_hand, to_hand))
+            if state.moves is None:
+                # The state was made by result_unchecked:
+                state = state._replace(moves=self.compute_moves(player=state.to_move, game_board=state.board),
+                                       utility=self.compute_utility(game_board=state.board, move=None,
+                                                                    player='c' if state.to_move == 'h' else 'h'))
+            # Hands are labelled L and R when there are two of them, and numbered otherwise:
+            labels = ('L', 'R') if self.num_hands == 2 else tuple(str(hand) for hand in range(self.num_hands))
+            human_readable_moves = [(labels[move[0]], labels[move[1]]) + tuple(move[2:]) for move in state.moves]
             game_state = 'to_move=%s, utility=%d, board=%s, moves of form (from_my, to_opponent)=%s' \
                          % (state.to_move, state.utility, state.board, human_readable_moves)
             print(game_state)
         else:
             super().display(state=state)
+
+
+class PackedChopsticksGame(ChopsticksGame):
+    """
+    PackedChopsticksGame: A ChopsticksGame whose states are single ints (see ChopsticksGame.encode) rather than
+        GameStates. Packed states are hashable, so they can be stored in sets and used as dictionary keys, and
+        actions, result, terminal_test and utility operate on them directly without building intermediate boards.
+        Use encode and decode to convert to and from the GameState representation.
+    """
+
+    def __init__(self, num_hands=2, num_fingers=5, fold_symmetries=False, splits=False, rollover=True):
+        super().__init__(num_hands=num_hands, num_fingers=num_fingers, fold_symmetries=fold_symmetries, splits=splits,
+                         rollover=rollover)
+        self.initial = self.encode(self.initial)
+        self.valid_moves = frozenset(move for row in self.all_moves for move in row).union(
+            *(self.compute_transfers(hands) for hands in self.side_fingers if splits))
+
+    def to_move(self, state):
+        """
+        to_move: Returns the player whose move it is in the provided packed state.
+        :param state: The packed state of the game.
+        :return player: 'h' if it is the human's turn to move, 'c' otherwise.
+        """
+        return 'h' if state & 1 else 'c'
+
+    def state_key(self, state):
+        """
+        state_key: Returns a hashable key identifying the provided packed state; the packed state itself, or its
+            canonical_key if symmetries are folded.
+        :param state: The packed state of the game.
+        :return key: The int key of the packed state.
+        """
+        return self.canonical_key(state) if self.fold_symmetries else state
+
+    def packed_key(self, state):
+        """
+        packed_key: Returns the packed encoding of the provided packed state; the state itself.
+        :param state: The packed state of the game.
+        :return packed_state: The packed state.
+        """
+        return state
+
+    def canonical(self, state):
+        """
+        canonical: Returns the canonical form of the provided packed state (see canonical_packed).
+        :param state: The packed state to canonicalize.
+        :return canonical_state: The packed state with each player's hands sorted.
+        """
+        return self.canonical_packed(state)
+
+    def actions(self, state):
+        """
+        actions: Returns a list of allowable moves given the current packed state.
+        :param state: The packed state of the game.
+        :return possible_actions: A list of performable actions of the form (from_hand, to_hand), and when splits are
+            allowed (from_hand, to_hand, num_fingers).
+        """
+        # Every move is read off the move generation tables of each player's side, so no hand is ever unpacked:
+        from_side, to_side = self.sides(state)
+        all_moves = self.all_moves
+        to_hands = self.side_hands[to_side]
+        moves = [all_moves[from_hand][to_hand] for from_hand in self.side_hands[from_side] for to_hand in to_hands]
+        if self.fold_symmetries and not self.rollover:
+            moves = self.distinct_moves(moves, self.side_fingers[from_side], self.side_fingers[to_side])
+        if self.splits:
+            moves += self.side_transfers[from_side]
+        return moves
+
+    def iter_actions(self, state):
+        """
+        iter_actions: Generates the allowable moves of the provided packed state lazily and in stages (see
+            staged_moves), for the searchers to draw from until they cut the state off.
+        :param state: The packed state of the game.
+        :return possible_actions: A generator of the moves of actions, most promising first.
+        """
+        return self.staged_moves(*self.sides(state))
+
+    def result(self, state, move):
+        """
+        result: Returns the packed state that results from making a move in the provided packed state.
+        :param state: The initial packed state.
+        :param move: The move performed in the initial state of the form: (from_hand, to_hand) or a transfer
+        :return resultant_state: The packed state resulting from the given move.
+        """
+        if move not in self.valid_moves:
+            # An invalid move results in no change to the game state:
+            return state
+        from_side, to_side = self.sides(state)
+        if len(move) == 3:
+            if move not in self.compute_transfers(self.side_fingers[from_side]):
+                return state
+        elif not self.side_fingers[from_side][move[0]] or not self.side_fingers[to_side][move[1]]:
+            # Hands which are out can neither attack nor be attacked:
+            return state
+        return self.result_unchecked(state, move)
+
+    # Packed states are moved directly by packed_result, without validating the move; the fast path for the searchers:
+    result_unchecked = ChopsticksGame.packed_result
+
+    def terminal_test(self, state):
+        """
+        terminal_test: Returns whether or not the provided packed state is a final state for the game.
+        :param state: The packed state of the game.
+        :return: True if either player has no fingers left, False otherwise.
+        """
+        board = state >> 1
+        return board % self.side_size == 0 or board < self.side_size
+
+    def utility(self, state, player):
+        """
+        utility: The value of the provided packed state to the provided player; 1 if the opponent has no fingers
+            left, -1 if the player has no fingers left, and 0 otherwise.
+        :param state: The packed state of the game.
+        :param player: The player ('h' or 'c') for whom the utility is computed.
+        :return utility: The utility of the state as viewed from the perspective of the provided player.
+        """
+        board = state >> 1
+        if board % self.side_size == 0:
+            # The human has no fingers left.
+            return -1 if player == 'h' else 1
+        elif board < self.side_size:
+            # The cpu has no fingers left.
+            return 1 if player == 'h' else -1
+        return 0
+
+    def display(self, state):
+        super().display(state=self.decode(state))
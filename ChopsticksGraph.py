@@ -0,0 +1,180 @@
+"""
+ChopsticksGraph.py
+The explicit state graph of a ChopsticksGame variant. Every position reachable from the initial state is enumerated
+once and numbered, and the moves between them are stored as compressed sparse rows of node numbers in flat arrays, so
+searches and analyses of a fixed variant walk integer indices instead of re-deriving successors from states.
+
+The arrays are plain array.array buffers; numpy.frombuffer views them without copying where NumPy is wanted.
+"""
+from array import array
+from aima.games import Game
+from ChopsticksGame import PackedChopsticksGame
+
+
+class StateGraph:
+    """
+    StateGraph: The reachable positions of a ChopsticksGame variant and the moves between them. Positions are numbered
+        in breadth-first order from the initial state, node 0, and one node stands for each state key, so when the game
+        folds symmetries each node is a canonical position. For node i:
+            states[i] and keys[i] are the packed state of the node and its ChopsticksGame.state_key;
+            successors[successor_offsets[i]:successor_offsets[i + 1]] are the nodes its moves lead to, one per move,
+                and move_ids at the same positions index the moves themselves in moves;
+            predecessors[predecessor_offsets[i]:predecessor_offsets[i + 1]] are the nodes with a move leading to it,
+                once for each such move;
+            terminal[i] is 1 if the game is over, and utility[i] is the utility of the node to the player to move.
+    """
+
+    def __init__(self, game, states, keys, successor_offsets, successors, move_ids, moves, terminal, utility):
+        """
+        :param game: The PackedChopsticksGame whose graph this is.
+        :param states: An array of the packed state of each node.
+        :param keys: An array of the state key of each node.
+        :param successor_offsets: An array of the offset of each node's first move in successors, and their total.
+        :param successors: An array of the node each move leads to.
+        :param move_ids: An array of the index in moves of each move.
+        :param moves: The distinct moves of the game.
+        :param terminal: A bytearray flagging the terminal nodes.
+        :param utility: An array of the utility of each node to the player to move.
+        """
+        self.game = game
+        self.states = states
+        self.keys = keys
+        self.successor_offsets = successor_offsets
+        self.successors = successors
+        self.move_ids = move_ids
+        self.moves = moves
+        self.terminal = terminal
+        self.utility = utility
+        # The number of each state key's node, or -1 for keys which are not reachable:
+        self.nodes = array('l', [-1]) * game.num_state_keys
+        for node, key in enumerate(keys):
+            self.nodes[key] = node
+        # The predecessor index is the successor index transposed, by a counting sort on the successors:
+        self.predecessor_offsets = array('l', [0]) * (len(states) + 1)
+        for successor in successors:
+            self.predecessor_offsets[successor + 1] += 1
+        for node in range(len(states)):
+            self.predecessor_offsets[node + 1] += self.predecessor_offsets[node]
+        self.predecessors = array('l', [0]) * len(successors)
+        filled = self.predecessor_offsets[:-1]
+        for node in range(len(states)):
+            for edge in range(successor_offsets[node], successor_offsets[node + 1]):
+                successor = successors[edge]
+                self.predecessors[filled[successor]] = node
+                filled[successor] += 1
+
+    def __len__(self):
+        """
+        :return: The number of nodes, or reachable positions.
+        """
+        return len(self.states)
+
+    def node(self, state):
+        """
+        node: Looks up the node of a state of the game.
+        :param state: A state of a ChopsticksGame (packed or not) of the graph's variant.
+        :return node: The number of the node of the state.
+        """
+        node = self.nodes[self.game.state_key(state)]
+        if node < 0:
+            raise KeyError('{} is not reachable in {}'.format(state, self.game))
+        return node
+
+    def successors_of(self, node):
+        """
+        :return: The nodes the moves of the provided node lead to.
+        """
+        return self.successors[self.successor_offsets[node]:self.successor_offsets[node + 1]]
+
+    def predecessors_of(self, node):
+        """
+        :return: The nodes with a move leading to the provided node.
+        """
+        return self.predecessors[self.predecessor_offsets[node]:self.predecessor_offsets[node + 1]]
+
+
+def build_graph(game):
+    """
+    build_graph: Enumerates every position reachable from the initial state of the provided game into a StateGraph.
+    :param game: The ChopsticksGame (packed or not) whose variant should be enumerated.
+    :return graph: The StateGraph of the variant.
+    """
+    game = PackedChopsticksGame(*game.variant)
+    nodes = array('l', [-1]) * game.num_state_keys
+    nodes[game.state_key(game.initial)] = 0
+    states = array('q', [game.initial])
+    keys = array('q', [game.state_key(game.initial)])
+    successor_offsets = array('l', [0])
+    successors = array('l')
+    move_ids = array('H')
+    moves = []
+    ids = {}
+    terminal = bytearray()
+    utility = array('b')
+    # Nodes are numbered as they are first reached, so the nodes still to expand are those after the one being expanded:
+    node = 0
+    while node < len(states):
+        state = states[node]
+        terminal.append(game.terminal_test(state))
+        utility.append(game.utility(state, game.to_move(state)))
+        if not terminal[node]:
+            for move in game.actions(state):
+                child = game.result_unchecked(state, move)
+                key = game.state_key(child)
+                if nodes[key] < 0:
+                    nodes[key] = len(states)
+                    states.append(child)
+                    keys.append(key)
+                if move not in ids:
+                    ids[move] = len(moves)
+                    moves.append(move)
+                successors.append(nodes[key])
+                move_ids.append(ids[move])
+        successor_offsets.append(len(successors))
+        node += 1
+    return StateGraph(game, states, keys, successor_offsets, successors, move_ids, moves, terminal, utility)
+
+
+class GraphGame(Game):
+    """
+    GraphGame: A ChopsticksGame played on its StateGraph; the states are node numbers, so actions, result,
+        terminal_test and utility are lookups in the graph's arrays, and the state key of a node is its number.
+    """
+    cyclic = True
+
+    def __init__(self, graph):
+        """
+        :param graph: The StateGraph of the variant to play.
+        """
+        self.graph = graph
+        self.initial = 0
+
+    def to_move(self, state):
+        return 'h' if self.graph.states[state] & 1 else 'c'
+
+    def actions(self, state):
+        graph = self.graph
+        moves = graph.moves
+        return [moves[move_id] for move_id in
+                graph.move_ids[graph.successor_offsets[state]:graph.successor_offsets[state + 1]]]
+
+    def result(self, state, move):
+        graph = self.graph
+        for edge in range(graph.successor_offsets[state], graph.successor_offsets[state + 1]):
+            if graph.moves[graph.move_ids[edge]] == move:
+                return graph.successors[edge]
+        # An invalid move results in no change to the game state:
+        return state
+
+    def terminal_test(self, state):
+        return self.graph.terminal[state]
+
+    def utility(self, state, player):
+        utility = self.graph.utility[state]
+        return utility if player == self.to_move(state) else -utility
+
+    def state_key(self, state):
+        return state
+
+    def display(self, state):
+        self.graph.game.display(self.graph.states[state])
@@ -0,0 +1,242 @@
+"""
+ChopsticksTablebase.py
+Retrograde analysis of the ChopsticksGame. Every position reachable from the initial state is solved by backward
+induction from the terminal positions, giving a tablebase from which perfect play can be read off in constant time.
+
+Tablebases can be saved to a compact file format, one byte per state key after a short header, which is opened
+as a MappedFile.
+"""
+from collections import deque
+from array import array
+import struct
+from ChopsticksGame import PackedChopsticksGame
+from ChopsticksGraph import build_graph
+from MappedFile import MappedFile, write_atomically
+
+# Outcomes of a position, from the perspective of the player to move; positions never reached are UNREACHED:
+UNREACHED, WIN, LOSS, DRAW = 0, 1, 2, 3
+
+# Tablebase files begin with a header of the magic number, the format version, the number of hands and fingers of the
+#   variant, whether symmetries are folded, splits allowed and hands rolled over, and the number of state keys which
+#   follow, one byte each. A byte of 0 is UNREACHED and 1 is DRAW;
+#   otherwise, less 2, its low bit is set for a WIN and the remaining bits hold the distance to mate:
+FILE_MAGIC = b'CHOPTB'
+FILE_VERSION = 3
+FILE_HEADER = struct.Struct('<6sHBB???Q')
+MAX_FILE_DEPTH = (255 - 2) >> 1
+
+
+class Tablebase:
+    """
+    Tablebase: The solution of a ChopsticksGame variant. Records, for every state key of the game (see
+        ChopsticksGame.state_key), the outcome with perfect play for the player to move and the number of plies until
+        the game ends (the distance to mate; 0 for drawn positions). When the game folds symmetries the keys are
+        canonical, so the tablebase holds each position only once whatever the order of the hands.
+    """
+
+    def __init__(self, game, outcomes, depths):
+        """
+        :param game: The PackedChopsticksGame that was solved.
+        :param outcomes: A bytearray holding the outcome of each state key.
+        :param depths: An array holding the distance to mate of each state key.
+        """
+        self.game = game
+        self.outcomes = outcomes
+        self.depths = depths
+
+    def probe(self, key):
+        """
+        probe: Looks up the solution of a position.
+        :param key: The ChopsticksGame.state_key of the position.
+        :return (outcome, depth): The outcome for the player to move and the distance to mate of the position.
+        """
+        outcome = self.outcomes[key]
+        if outcome == UNREACHED:
+            raise KeyError('Position {} is not reachable in {}'.format(key, self.game))
+        return outcome, self.depths[key]
+
+    def best_move(self, game, state):
+        """
+        best_move: Returns a move which preserves the outcome of the provided position; the quickest win, the slowest
+            loss, or a move which keeps the game drawn.
+        :param game: The ChopsticksGame (packed or not) the state belongs to, of the same variant as the tablebase.
+        :param state: The state to move from.
+        :return move: The best move available in the provided state.
+        """
+        outcome, depth = self.probe(game.state_key(state))
+        # The outcome the opponent should be left with by the best move, and how far from mate it should be:
+        wanted = {WIN: (LOSS, depth - 1), LOSS: (WIN, depth - 1), DRAW: (DRAW, 0)}[outcome]
+        for move in game.actions(state):
+            if self.probe(game.state_key(game.result_unchecked(state, move))) == wanted:
+                return move
+        raise ValueError('Tablebase is inconsistent at position {}'.format(game.state_key(state)))
+
+    def __len__(self):
+        """
+        :return: The number of reachable positions.
+        """
+        return len(self.outcomes) - self.outcomes.count(UNREACHED)
+
+
+def solve(game, graph=None):
+    """
+    solve: Solves every position reachable from the initial state of the provided game by retrograde analysis. Terminal
+        positions are labelled by terminal_test and utility; a position is then a WIN if some move leads to a LOSS for
+        the opponent, a LOSS if every move leads to a WIN for the opponent, and a DRAW if neither can ever be shown.
+    :param game: The ChopsticksGame (packed or not) whose variant should be solved.
+    :param graph: The StateGraph of the variant, if it has already been built (see build_graph).
+    :return tablebase: The Tablebase of the variant.
+    """
+    if graph is None:
+        graph = build_graph(game)
+    node_outcomes = bytearray(len(graph))
+    node_depths = array('H', [0]) * len(graph)
+    # The number of moves from each position which have not yet been shown to lead to a WIN for the opponent:
+    unresolved = array('l', (graph.successor_offsets[node + 1] - graph.successor_offsets[node]
+                             for node in range(len(graph))))
+    solved = deque()
+    for node in range(len(graph)):
+        if graph.terminal[node]:
+            utility = graph.utility[node]
+            node_outcomes[node] = WIN if utility > 0 else LOSS if utility < 0 else DRAW
+            solved.append(node)
+    # Backward induction along the predecessor index; positions are solved in order of increasing distance to mate,
+    #   so the first WIN found for a position is its quickest and the last move to resolve a LOSS is its slowest:
+    while solved:
+        child = solved.popleft()
+        if node_outcomes[child] == DRAW:
+            continue
+        for node in graph.predecessors_of(child):
+            if node_outcomes[node] != UNREACHED:
+                continue
+            if node_outcomes[child] == LOSS:
+                node_outcomes[node] = WIN
+            else:
+                unresolved[node] -= 1
+                if unresolved[node]:
+                    continue
+                node_outcomes[node] = LOSS
+            node_depths[node] = node_depths[child] + 1
+            solved.append(node)
+    # Whatever could not be resolved can be played forever by both players; the solution is then indexed by state key:
+    outcomes = bytearray(graph.game.num_state_keys)
+    depths = array('H', [0]) * graph.game.num_state_keys
+    for node, key in enumerate(graph.keys):
+        outcomes[key] = node_outcomes[node] or DRAW
+        depths[key] = node_depths[node]
+    return Tablebase(graph.game, outcomes, depths)
+
+
+class TablebaseFile(Tablebase, MappedFile):
+    """
+    TablebaseFile: A Tablebase read from a file written by write_tablebase, as a MappedFile.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: The path of the tablebase file.
+        """
+        *variant, num_states = self.map_file(path, FILE_HEADER, FILE_MAGIC, FILE_VERSION, 'tablebase')
+        game = PackedChopsticksGame(*variant)
+        if num_states != game.num_state_keys or len(self.data) != FILE_HEADER.size + num_states:
+            self.close()
+            raise ValueError('{} is truncated or corrupt'.format(path))
+        self.game = game
+        self.num_states = num_states
+
+    def probe(self, key):
+        """
+        probe: Looks up the solution of a position in the file.
+        :param key: The ChopsticksGame.state_key of the position.
+        :return (outcome, depth): The outcome for the player to move and the distance to mate of the position.
+        """
+        if not 0 <= key < self.num_states:
+            raise IndexError('Position {} is outside of the tablebase of {}'.format(key, self.game))
+        value = self.data[FILE_HEADER.size + key]
+        if value == UNREACHED:
+            raise KeyError('Position {} is not reachable in {}'.format(key, self.game))
+        elif value == 1:
+            return DRAW, 0
+        value -= 2
+        return WIN if value & 1 else LOSS, value >> 1
+
+    def __len__(self):
+        """
+        :return: The number of reachable positions.
+        """
+        return self.num_states - self.data[FILE_HEADER.size:].count(UNREACHED)
+
+
+def misplays(tablebase, player):
+    """
+    misplays: Checks a player against the perfect play of a tablebase, finding every reachable position in which the
+        move it chooses does not keep the outcome the tablebase gives the player to move (or, in a won or lost
+        position, does not win as quickly or lose as slowly as possible).
+    :param tablebase: The Tablebase of the variant.
+    :param player: The player to check, called as player(game, state) with the PackedChopsticksGame of the tablebase.
+    :return states: The packed states in which the player misplays.
+    """
+    game = tablebase.game
+    states = []
+    for state in range(game.num_packed_states):
+        key = game.state_key(state)
+        if tablebase.outcomes[key] == UNREACHED or game.terminal_test(state):
+            continue
+        outcome, depth = tablebase.probe(key)
+        wanted = {WIN: (LOSS, depth - 1), LOSS: (WIN, depth - 1), DRAW: (DRAW, 0)}[outcome]
+        if tablebase.probe(game.state_key(game.result(state, player(game, state)))) != wanted:
+            states.append(state)
+    return states
+
+
+def write_tablebase(tablebase, path):
+    """
+    write_tablebase: Saves a Tablebase to a file which can be opened with TablebaseFile. The file is written with
+        write_atomically.
+    :param tablebase: The Tablebase to save.
+    :param path: The path of the tablebase file.
+    """
+    game = tablebase.game
+    data = bytearray(game.num_state_keys)
+    for key, outcome in enumerate(tablebase.outcomes):
+        if outcome == UNREACHED:
+            continue
+        elif outcome == DRAW:
+            data[key] = 1
+            continue
+        depth = tablebase.depths[key]
+        if depth > MAX_FILE_DEPTH:
+            raise ValueError('Distance to mate {} of position {} cannot be saved'.format(depth, key))
+        data[key] = 2 + (depth << 1 | (1 if outcome == WIN else 0))
+    with write_atomically(path) as file:
+        file.write(FILE_HEADER.pack(FILE_MAGIC, FILE_VERSION, *game.variant, game.num_state_keys))
+        file.write(data)
+
+
+# Solved tablebases, by ChopsticksGame.variant, shared by every tablebase_player:
+tablebases = {}
+
+
+def open_tablebase(path):
+    """
+    open_tablebase: Opens a tablebase file and makes tablebase_player probe it for its variant, instead of solving the
+        variant on first use.
+    :param path: The path of the tablebase file.
+    :return tablebase: The TablebaseFile.
+    """
+    tablebase = TablebaseFile(path)
+    tablebases[tablebase.game.variant] = tablebase
+    return tablebase
+
+
+def tablebase_player(game, state):
+    """
+    tablebase_player: A player that plays perfectly by consulting the Tablebase of the game; the file opened for the
+        variant by open_tablebase if there is one, or else the variant is solved the first time it is played.
+    :param game: The ChopsticksGame (packed or not) being played.
+    :param state: The current state of the game.
+    :return move: The best move available in the provided state.
+    """
+    if game.variant not in tablebases:
+        tablebases[game.variant] = solve(game)
+    return tablebases[game.variant].best_move(game, state)
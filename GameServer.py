@@ -0,0 +1,421 @@
+"""
+GameServer.py
+An asyncio server hosting games of Chopsticks against the computer players, many at once, for clients speaking a
+line-delimited JSON protocol over TCP or a Unix socket. Each connection plays one game at a time. Searches run in a
+pool of worker processes, so the event loop only ever parses, validates and forwards moves.
+
+Each request and reply is one JSON object on one line. Moves are JSON arrays such as [0, 1]:
+    {"type": "new", "player": "alphabeta", "first": true, "variant": [2, 5, false, false, true]}
+        Starts a new game against the named player (see PLAYERS), the client moving first if first is true. The
+        variant, as ChopsticksGame.variant, defaults to the standard game; how large it may be depends on the player
+        (see MAX_STATES). The reply is a state or, should the
+        server's opening move end the game, over.
+    {"type": "move", "move": [0, 1]}
+        Makes a move for the client, and the server's reply to it. The reply is a state or over.
+    {"type": "state", "board": {"human": [1, 1], "cpu": [1, 1]}, "to_move": "c", "you": "c", "moves": [[0, 0], ...],
+     "reply": [0, 1], "plies": 2}
+        The board after the server's reply (null if it has not moved), the client's side and its legal moves.
+    {"type": "over", "utility": 1, "reason": "terminal", "reply": [0, 1], "plies": 7}
+        The game has ended; the utility is to the client and the reason is as in GameResult.
+    {"type": "error", "error": "..."}
+        The request was not understood or the move is not legal; the game, if any, is unchanged. Should the server
+        itself fail, the game in progress is ended.
+
+The same module generates load against a server, reporting the moves played per second and the latency of each request
+(and so of each of the server's moves) as the client sees it:
+
+    python GameServer.py serve --port 8765
+    python GameServer.py load --port 8765 --clients 1000 --games 10
+"""
+import argparse
+import asyncio
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import json
+import random
+import sys
+import time
+from ChopsticksGame import PackedChopsticksGame
+from ChopsticksTablebase import tablebase_player
+from aima.games import (GameResult, LatencyHistogram, alphabeta_player, iterative_deepening_player, mcts_player,
+                        random_player)
+
+# The players clients can play against, by name:
+PLAYERS = {
+    'alphabeta': alphabeta_player,
+    'iterative_deepening': iterative_deepening_player,
+    'mcts': mcts_player,
+    'random': random_player,
+    'tablebase': tablebase_player,
+}
+# Players quick enough to move on the event loop itself; every other player is run in the executor:
+INLINE_PLAYERS = frozenset({'random'})
+DEFAULT_VARIANT = (2, 5, False, False, True)
+# The most positions (see ChopsticksGame.num_packed_states) a variant served may have, by player. The move tables of
+#   a variant are quick to build, but alphabeta solves every position reachable from each it moves in (see
+#   retrograde_search) and tablebase solves the whole variant once in each worker, so they are held to far fewer:
+MAX_STATES = {
+    'alphabeta': 2 ** 16,
+    'iterative_deepening': 2 ** 22,
+    'mcts': 2 ** 22,
+    'random': 2 ** 22,
+    'tablebase': 2 ** 18,
+}
+
+# The games of this process (the server or a worker), by variant, made on first use:
+_games = {}
+
+
+def make_game(variant):
+    """
+    make_game: Returns the PackedChopsticksGame of a variant, made once per process.
+    :param variant: The variant, as ChopsticksGame.variant.
+    :return game: The game.
+    """
+    if variant not in _games:
+        _games[variant] = PackedChopsticksGame(*variant)
+    return _games[variant]
+
+
+def parse_variant(variant, player):
+    """
+    parse_variant: Validates the variant of a new request.
+    :param variant: The variant, as a JSON array of the arguments of ChopsticksGame.
+    :param player: The name of the player (see PLAYERS) the variant is to be played against.
+    :return variant: The variant as a tuple.
+    """
+    if (not isinstance(variant, list) or len(variant) != len(DEFAULT_VARIANT)
+            or not all(type(value) is type(default) for value, default in zip(variant, DEFAULT_VARIANT))):
+        raise ValueError('Invalid variant {!r}'.format(variant))
+    num_hands, num_fingers = variant[:2]
+    max_states = MAX_STATES[player]
+    # Every variant of more than max_states positions has too many hands or fingers to be worth counting them:
+    if (num_hands < 1 or num_fingers < 2 or num_hands > max_states.bit_length() or num_fingers > max_states
+            or 2 * num_fingers ** (2 * num_hands) > max_states):
+        raise ValueError('Unsupported variant {!r} for player {!r}'.format(variant, player))
+    return tuple(variant)
+
+
+def server_move(variant, player, state):
+    """
+    server_move: Chooses the server's move; run in the worker processes, so only the variant, the player's name and the
+        packed state are sent to them.
+    :param variant: The variant being played.
+    :param player: The name of the player (see PLAYERS).
+    :param state: The packed state to move in.
+    :return move: The move chosen.
+    """
+    return PLAYERS[player](make_game(variant), state)
+
+
+class GameSession:
+    """
+    GameSession: A game between a client and a server player, played by the rules of Game.play_game; the game is drawn
+        after max_plies moves, or when a position occurs for the repetitions-th time.
+    """
+
+    def __init__(self, game, player, client_first, max_plies=1000, repetitions=3):
+        """
+        :param game: The PackedChopsticksGame being played.
+        :param player: The name of the server's player (see PLAYERS).
+        :param client_first: Whether the client makes the first move.
+        :param max_plies: The number of moves after which the game is drawn.
+        :param repetitions: The number of occurrences of a position at which the game is drawn.
+        """
+        self.game = game
+        self.player = player
+        self.client_first = client_first
+        self.max_plies = max_plies
+        self.repetitions = repetitions
+        self.state = game.initial
+        self.history = defaultdict(int)
+        self.history[game.state_key(self.state)] += 1
+        self.moves = []
+        self.move_times = []
+        first = game.to_move(game.initial)
+        self.client = first if client_first else 'h' if first == 'c' else 'c'
+
+    @property
+    def client_to_move(self):
+        """Whether it is the client's turn to move."""
+        return self.game.to_move(self.state) == self.client
+
+    def play(self, move, seconds):
+        """
+        play: Makes a legal move.
+        :param move: The move.
+        :param seconds: The seconds taken to choose the move.
+        :return result: The GameResult if the move ended the game, or else None.
+        """
+        game = self.game
+        self.moves.append(move)
+        self.move_times.append(seconds)
+        self.state = game.result(self.state, move)
+        first = game.to_move(game.initial)
+        if game.terminal_test(self.state):
+            return GameResult(game.utility(self.state, first), len(self.moves), 'terminal', self.moves,
+                              self.move_times)
+        key = game.state_key(self.state)
+        self.history[key] += 1
+        if self.repetitions is not None and self.history[key] >= self.repetitions:
+            return GameResult(0, len(self.moves), 'repetition', self.moves, self.move_times)
+        if self.max_plies is not None and len(self.moves) >= self.max_plies:
+            return GameResult(0, len(self.moves), 'max_plies', self.moves, self.move_times)
+        return None
+
+    def client_utility(self, result):
+        """The utility of a GameResult to the client, rather than to the first player."""
+        return result.utility if self.client_first else -result.utility
+
+
+class GameServer:
+    """
+    GameServer: Serves games to clients (see the protocol above). Every connection is handled by its own coroutine and
+        searches are awaited in the executor, so thousands of games proceed at once on one event loop.
+    """
+
+    def __init__(self, executor=None, max_plies=1000, repetitions=3):
+        """
+        :param executor: The concurrent.futures executor searches are run in; a ProcessPoolExecutor with a worker per
+            CPU by default.
+        :param max_plies: The number of moves after which a game is drawn.
+        :param repetitions: The number of occurrences of a position at which a game is drawn.
+        """
+        self.executor = executor or ProcessPoolExecutor()
+        self.max_plies = max_plies
+        self.repetitions = repetitions
+        self.sessions = 0
+        self.games_played = 0
+
+    async def server_move(self, session):
+        """
+        server_move: Chooses and makes the server's move in a session.
+        :param session: The GameSession.
+        :return (move, result): The move, and the GameResult if it ended the game or else None.
+        """
+        start = time.perf_counter()
+        if session.player in INLINE_PLAYERS:
+            move = server_move(session.game.variant, session.player, session.state)
+        else:
+            move = await asyncio.get_running_loop().run_in_executor(
+                self.executor, server_move, session.game.variant, session.player, session.state)
+        return move, session.play(move, time.perf_counter() - start)
+
+    def reply(self, session, move, result):
+        """
+        reply: The reply to the client after the server has moved, or the game has ended.
+        :param session: The GameSession.
+        :param move: The server's move, or None if it has not moved.
+        :param result: The GameResult if the game has ended, or else None.
+        :return reply: The reply, ready to be sent as JSON.
+        """
+        if result is not None:
+            self.games_played += 1
+            return {'type': 'over', 'utility': session.client_utility(result), 'reason': result.reason,
+                    'reply': move, 'plies': result.plies}
+        board = session.game.decode(session.state).board
+        return {'type': 'state', 'board': board, 'to_move': session.game.to_move(session.state),
+                'you': session.client, 'moves': session.game.actions(session.state), 'reply': move,
+                'plies': len(session.moves)}
+
+    async def new_game(self, request):
+        """
+        new_game: Starts the game asked for by a new request, making the server's opening move if it has the first.
+        :param request: The request.
+        :return (session, reply): The GameSession and the reply to the client.
+        """
+        player = request.get('player', 'alphabeta')
+        if not isinstance(player, str) or player not in PLAYERS:
+            raise ValueError('Unknown player {!r}; expected one of {}'.format(player, sorted(PLAYERS)))
+        variant = parse_variant(request.get('variant', list(DEFAULT_VARIANT)), player)
+        session = GameSession(make_game(variant), player, bool(request.get('first', True)),
+                              self.max_plies, self.repetitions)
+        self.sessions += 1
+        if session.client_to_move:
+            return session, self.reply(session, None, None)
+        return session, self.reply(session, *await self.server_move(session))
+
+    async def client_move(self, session, request):
+        """
+        client_move: Makes the client's move of a move request, and the server's reply to it.
+        :param session: The GameSession.
+        :param request: The request.
+        :return reply: The reply to the client.
+        """
+        if session is None:
+            raise ValueError('No game in progress')
+        move = request.get('move')
+        # JSON has no tuples, so moves arrive as lists:
+        move = tuple(move) if isinstance(move, list) else move
+        try:
+            legal = move in session.game.actions(session.state)
+        except TypeError:
+            legal = False
+        if not legal:
+            raise ValueError('Invalid move {!r}'.format(request.get('move')))
+        result = session.play(move, 0)
+        if result is not None:
+            return self.reply(session, None, result)
+        return self.reply(session, *await self.server_move(session))
+
+    async def handle(self, reader, writer):
+        """
+        handle: Serves one connection until the client closes it.
+        :param reader: The StreamReader of the connection.
+        :param writer: The StreamWriter of the connection.
+        """
+        session = None
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, ConnectionError):
+                    # The line was too long to be a request, or the client went away:
+                    break
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError('Expected a JSON object')
+                    if request.get('type') == 'new':
+                        session, reply = await self.new_game(request)
+                    elif request.get('type') == 'move':
+                        reply = await self.client_move(session, request)
+                    else:
+                        raise ValueError('Unknown request type {!r}'.format(request.get('type')))
+                    if reply['type'] == 'over':
+                        session = None
+                except ValueError as error:
+                    reply = {'type': 'error', 'error': str(error)}
+                except Exception as error:
+                    # Anything else went wrong in the server, perhaps part way through a move, so the game is ended
+                    #   rather than left in a state the client cannot know:
+                    session = None
+                    reply = {'type': 'error', 'error': 'Internal error ({}); the game has ended'.format(
+                        type(error).__name__)}
+                writer.write(json.dumps(reply).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host=None, port=None, path=None):
+        """
+        start: Starts serving on a TCP port, or on a Unix socket if a path is given.
+        :param host: The host to listen on for TCP.
+        :param port: The port to listen on for TCP.
+        :param path: The path of the Unix socket.
+        :return server: The asyncio Server.
+        """
+        if path is not None:
+            return await asyncio.start_unix_server(self.handle, path=path)
+        return await asyncio.start_server(self.handle, host=host, port=port)
+
+
+async def connect(host=None, port=None, path=None):
+    """
+    connect: Connects to a GameServer over TCP, or over a Unix socket if a path is given.
+    :return (reader, writer): The streams of the connection.
+    """
+    if path is not None:
+        return await asyncio.open_unix_connection(path)
+    return await asyncio.open_connection(host, port)
+
+
+async def load_client(address, player, n_games, histogram, totals, rng):
+    """
+    load_client: One client of a load test; plays n_games games over one connection, moving at random, and records the
+        time from sending each request to receiving its reply.
+    :param address: The (host, port, path) of the server.
+    :param player: The name of the server's player.
+    :param n_games: The number of games to play.
+    :param histogram: The LatencyHistogram the latencies are added to.
+    :param totals: A dict counting the moves, games and errors of every client.
+    :param rng: The random number generator choosing the client's moves.
+    """
+    reader, writer = await connect(*address)
+
+    async def request(message):
+        start = time.perf_counter()
+        writer.write(json.dumps(message).encode() + b'\n')
+        await writer.drain()
+        reply = json.loads(await reader.readline())
+        histogram.add(time.perf_counter() - start)
+        if reply['type'] == 'error':
+            totals['errors'] += 1
+        return reply
+
+    try:
+        for game in range(n_games):
+            reply = await request({'type': 'new', 'player': player, 'first': game % 2 == 0})
+            while reply['type'] == 'state':
+                reply = await request({'type': 'move', 'move': rng.choice(reply['moves'])})
+                totals['moves'] += 1
+            totals['games'] += 1
+    finally:
+        writer.close()
+
+
+async def run_load(address, clients, n_games, player, seed=0):
+    """
+    run_load: Runs a load test; clients clients at once, each playing n_games games against player.
+    :param address: The (host, port, path) of the server.
+    :param clients: The number of concurrent clients.
+    :param n_games: The number of games each client plays.
+    :param player: The name of the server's player.
+    :param seed: The seed of the clients' moves.
+    :return report: The moves and games played, errors, seconds taken, moves per second and percentiles of the latency
+        of the requests in seconds.
+    """
+    histogram = LatencyHistogram()
+    totals = defaultdict(int)
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    await asyncio.gather(*(load_client(address, player, n_games, histogram, totals, random.Random(rng.getrandbits(64)))
+                           for _ in range(clients)))
+    seconds = time.perf_counter() - start
+    return {'moves': totals['moves'], 'games': totals['games'], 'errors': totals['errors'], 'seconds': seconds,
+            'moves_per_sec': totals['moves'] / seconds,
+            'latency': {p: histogram.percentile(p) for p in (50, 90, 99)}}
+
+
+async def serve(args):
+    executor = ProcessPoolExecutor(max_workers=args.workers)
+    server = await GameServer(executor, args.max_plies, args.repetitions).start(args.host, args.port, args.path)
+    print('Serving on {}'.format(', '.join(str(socket.getsockname()) for socket in server.sockets)), file=sys.stderr)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve games of Chopsticks, or generate load against a server.')
+    parser.add_argument('mode', choices=('serve', 'load'), help='whether to serve games or generate load')
+    parser.add_argument('--host', default='127.0.0.1', help='the host to serve on or connect to (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8765, help='the TCP port (default: 8765)')
+    parser.add_argument('--path', help='a Unix socket to use instead of TCP')
+    parser.add_argument('--workers', type=int, help='the processes searching for the server (default: one per CPU)')
+    parser.add_argument('--max-plies', type=int, default=1000, help='the moves after which a game is drawn')
+    parser.add_argument('--repetitions', type=int, default=3, help='the repeats of a position which draw a game')
+    parser.add_argument('--clients', type=int, default=100, help='the concurrent clients of a load test')
+    parser.add_argument('--games', type=int, default=10, help='the games played by each client of a load test')
+    parser.add_argument('--player', choices=sorted(PLAYERS), default='alphabeta',
+                        help="the server's player in a load test (default: alphabeta)")
+    parser.add_argument('--seed', type=int, default=0, help="the seed of the load test's moves (default: 0)")
+    args = parser.parse_args()
+    if args.mode == 'serve':
+        try:
+            asyncio.run(serve(args))
+        except KeyboardInterrupt:
+            pass
+        return
+    report = asyncio.run(run_load((args.host, args.port, args.path), args.clients, args.games, args.player, args.seed))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+MappedFile.py
+The file handling shared by the tablebase and opening book formats (see ChopsticksTablebase and OpeningBook). Files are
+opened with mmap, so that opening one is instant however large it is, every process using it shares the same pages,
+and only the pages actually read are ever loaded. Files are written next to their destination and then moved into
+place, so processes never see a partially written file.
+"""
+from contextlib import contextmanager
+import mmap
+import os
+
+
+class MappedFile:
+    """
+    MappedFile: A file memory-mapped rather than read, beginning with a header whose first two fields are a magic number
+        and a format version. Subclasses map their file with map_file and read the rest of it from data.
+    """
+
+    def map_file(self, path, header, magic, version, kind):
+        """
+        map_file: Maps a file as the data of this object, checking its magic number and format version.
+        :param path: The path of the file.
+        :param header: The struct.Struct of the header of the file.
+        :param magic: The magic number the file must begin with.
+        :param version: The format version the file must have.
+        :param kind: What the file holds, e.g. 'tablebase', for the errors raised.
+        :return fields: The fields of the header after the magic number and version.
+        """
+        with open(path, 'rb') as file:
+            # mmap refuses to map an empty file, so the size is checked first:
+            if os.fstat(file.fileno()).st_size < header.size:
+                raise ValueError('{} is too short to be a {} file'.format(path, kind))
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        file_magic, file_version, *fields = header.unpack_from(self.data)
+        if file_magic != magic:
+            self.close()
+            raise ValueError('{} is not a {} file'.format(path, kind))
+        if file_version != version:
+            self.close()
+            raise ValueError('{} has {} format version {}; expected {}'.format(path, kind, file_version, version))
+        return fields
+
+    def close(self):
+        """
+        close: Unmaps the file.
+        """
+        self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+@contextmanager
+def write_atomically(path):
+    """
+    write_atomically: Opens a temporary file next to path for writing in binary, and moves it into place once the with
+        block exits; should the block fail, the temporary file is removed and path is left as it was.
+    :param path: The path of the file to write.
+    :return file: The temporary file.
+    """
+    temporary_path = '{}.{}.tmp'.format(path, os.getpid())
+    try:
+        with open(temporary_path, 'wb') as file:
+            yield file
+    except BaseException:
+        os.remove(temporary_path)
+        raise
+    os.replace(temporary_path, path)
@@ -0,0 +1,343 @@
+"""
+OpeningBook.py
+Opening books for the ChopsticksGame and the TicTacToe family (ConnectFour above all). Every position within a few
+plies of the initial state is searched once, ahead of time, and its best move saved to a file, so players consult the
+book for the opening moves of a game, the slowest to search, instead of searching them afresh in every game.
+
+A book file holds one entry per position, keyed by a 64-bit hash of the position, sorted so that entries are found by
+binary search, and is opened as a MappedFile. Books are built in parallel by a pool of worker processes, and each
+move found is logged to a journal as it arrives, so a build which is interrupted resumes where it left off:
+
+    python OpeningBook.py chopsticks chopsticks.book --depth 10
+    python OpeningBook.py connectfour connectfour.book --depth 4 --search-depth 6
+"""
+import argparse
+import ast
+from array import array
+from bisect import bisect_left
+from functools import partial
+from hashlib import blake2b
+import multiprocessing
+import os
+import struct
+import sys
+from ChopsticksGame import ChopsticksGame, PackedChopsticksGame
+from MappedFile import MappedFile, write_atomically
+from aima.games import TicTacToe, ConnectFour, BitboardConnectFour, alphabeta_player, alphabeta_cutoff_search
+from aima.utils import name
+
+# Book files begin with a header of the magic number, the format version, the depth the book was built to, the lengths
+#   of the game's signature (see game_signature) and of the table of moves which follow it, and the number of entries.
+#   The signature and move table (the repr of a tuple of the distinct moves) follow, padded to a multiple of 8 bytes,
+#   then the sorted 64-bit hashes of the positions, and last the index in the move table of each position's move:
+FILE_MAGIC = b'OPBOOK'
+FILE_VERSION = 1
+FILE_HEADER = struct.Struct('<6sHHHIQ')
+
+
+def game_signature(game):
+    """
+    game_signature: Identifies the positions and moves of a game, so a book is only ever consulted for the game it was
+        built for. ChopsticksGames of either representation share their keys and moves, and so their books.
+    :param game: The game.
+    :return signature: A string naming the game and its variant or board size.
+    """
+    if isinstance(game, ChopsticksGame):
+        return 'ChopsticksGame{}'.format(game.variant)
+    if isinstance(game, TicTacToe):
+        return '{}{}'.format(type(game).__name__, (game.h, game.v, game.k))
+    return type(game).__name__
+
+
+def book_key(game, state):
+    """
+    book_key: Returns the key a position is booked under; its Game.state_key, except that a ChopsticksGame folding
+        symmetries keys positions differing only in the order of the hands alike, though the same move is not best in
+        each, so those positions are keyed by their packed encoding.
+    :param game: The game.
+    :param state: The state of the position.
+    :return key: The key of the position.
+    """
+    if getattr(game, 'fold_symmetries', False):
+        return game.packed_key(state)
+    return game.state_key(state)
+
+
+def book_hash(key):
+    """
+    book_hash: Hashes a book key to the 64 bits stored in book files. Keys are hashed by their repr, which for ints,
+        including the wide keys of the bitboard games, is the same in every process and on every run.
+    :param key: The book key of a position (see book_key).
+    :return hash: The 64-bit hash of the key.
+    """
+    return int.from_bytes(blake2b(repr(key).encode(), digest_size=8).digest(), 'little')
+
+
+def book_positions(game, depth):
+    """
+    book_positions: Enumerates the non-terminal positions reachable from the initial state of a game in at most depth
+        plies, breadth-first, each once.
+    :param game: The game.
+    :param depth: The number of plies.
+    :return positions: A list of (hash, state) of each position (see book_hash).
+    """
+    seen = {book_hash(book_key(game, game.initial))}
+    frontier = [game.initial]
+    positions = []
+    for ply in range(depth + 1):
+        next_frontier = []
+        for state in frontier:
+            if game.terminal_test(state):
+                continue
+            positions.append((book_hash(book_key(game, state)), state))
+            if ply == depth:
+                continue
+            for move in game.actions(state):
+                child = game.result(state, move)
+                h = book_hash(book_key(game, child))
+                if h not in seen:
+                    seen.add(h)
+                    next_frontier.append(child)
+        frontier = next_frontier
+    return positions
+
+
+class OpeningBook(MappedFile):
+    """
+    OpeningBook: A book file written by build_book or write_book, opened as a MappedFile.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: The path of the book file.
+        """
+        self.keys = None
+        self.depth, signature_size, moves_size, num_entries = self.map_file(path, FILE_HEADER, FILE_MAGIC,
+                                                                            FILE_VERSION, 'book')
+        offset = FILE_HEADER.size
+        self.signature = self.data[offset:offset + signature_size].decode()
+        offset += signature_size
+        self.moves = ast.literal_eval(self.data[offset:offset + moves_size].decode())
+        offset += moves_size
+        offset += -offset % 8
+        if len(self.data) != offset + 10 * num_entries:
+            self.close()
+            raise ValueError('{} is truncated or corrupt'.format(path))
+        self.keys = memoryview(self.data)[offset:offset + 8 * num_entries].cast('Q')
+        self.move_ids = memoryview(self.data)[offset + 8 * num_entries:].cast('H')
+
+    def lookup(self, game, state):
+        """
+        lookup: Looks up the booked move of a position.
+        :param game: The game the state belongs to, which the book must have been built for.
+        :param state: The state of the position.
+        :return move: The booked move, or None if the position is not in the book.
+        """
+        if game_signature(game) != self.signature:
+            raise ValueError('Book of {} consulted for {}'.format(self.signature, game_signature(game)))
+        h = book_hash(book_key(game, state))
+        i = bisect_left(self.keys, h)
+        if i == len(self.keys) or self.keys[i] != h:
+            return None
+        move = self.moves[self.move_ids[i]]
+        # Guard against the (vanishingly unlikely) collision of two positions' hashes:
+        return move if move in game.actions(state) else None
+
+    def __len__(self):
+        """
+        :return: The number of positions in the book.
+        """
+        return len(self.keys)
+
+    def close(self):
+        """
+        close: Unmaps the file.
+        """
+        if self.keys is not None:
+            self.keys.release()
+            self.move_ids.release()
+        super().close()
+
+
+def write_book(game, depth, entries, path):
+    """
+    write_book: Saves the moves of a book to a file which can be opened with OpeningBook. The file is written with
+        write_atomically.
+    :param game: The game the book was built for.
+    :param depth: The depth the book was built to.
+    :param entries: A dict of the move of each position, by hash (see book_hash).
+    :param path: The path of the book file.
+    """
+    signature = game_signature(game).encode()
+    moves = sorted(set(entries.values()))
+    move_ids = {move: i for i, move in enumerate(moves)}
+    moves_repr = repr(tuple(moves)).encode()
+    hashes = sorted(entries)
+    with write_atomically(path) as file:
+        file.write(FILE_HEADER.pack(FILE_MAGIC, FILE_VERSION, depth, len(signature), len(moves_repr), len(hashes)))
+        file.write(signature)
+        file.write(moves_repr)
+        file.write(bytes(-(FILE_HEADER.size + len(signature) + len(moves_repr)) % 8))
+        file.write(array('Q', hashes))
+        file.write(array('H', (move_ids[entries[h]] for h in hashes)))
+
+
+def read_journal(path, signature):
+    """
+    read_journal: Reads back the moves logged by an interrupted build_book. A line cut short by the interruption is
+        ignored; its position is simply searched again.
+    :param path: The path of the journal.
+    :param signature: The signature of the game being booked, which the journal must have been started for.
+    :return entries: A dict of the move of each position logged, by hash.
+    """
+    entries = {}
+    if not os.path.exists(path):
+        return entries
+    with open(path) as file:
+        lines = file.read().splitlines()
+    if lines and lines[0] != repr(signature):
+        raise ValueError('{} is the journal of a book of {}, not {}'.format(path, lines[0], signature))
+    for line in lines[1:]:
+        try:
+            h, move = ast.literal_eval(line)
+        except (ValueError, SyntaxError):
+            continue
+        entries[h] = move
+    return entries
+
+
+# The game and player of the worker processes of a build_book:
+_worker_game = None
+_worker_player = None
+
+
+def _init_book_worker(game, player):
+    global _worker_game, _worker_player
+    _worker_game = game
+    _worker_player = player
+
+
+def _book_move(position):
+    """Search one position of a book; return its hash and best move."""
+    h, state = position
+    return h, _worker_player(_worker_game, state)
+
+
+def build_book(game, path, depth, player=alphabeta_player, workers=None):
+    """
+    build_book: Builds the opening book of a game; the move player chooses in every position within depth plies of the
+        initial state. Positions are shared between a pool of worker processes (os.cpu_count() of them by default; 1
+        searches them in this process), so the game and player must be picklable. Each move is logged to a journal
+        next to the book as it arrives, and a build which is interrupted skips the positions already logged when run
+        again; the journal is removed once the book is written.
+    :param game: The game to book.
+    :param path: The path of the book file.
+    :param depth: The number of plies the book covers.
+    :param player: The player whose moves are booked, e.g. partial(cutoff_player, d=8).
+    :param workers: The number of worker processes.
+    :return book: The OpeningBook, opened from the file written.
+    """
+    signature = game_signature(game)
+    journal_path = path + '.journal'
+    entries = read_journal(journal_path, signature)
+    positions = book_positions(game, depth)
+    todo = [position for position in positions if position[0] not in entries]
+    workers = workers or os.cpu_count()
+    with open(journal_path, 'a', buffering=1) as journal:
+        if not journal.tell():
+            journal.write(repr(signature) + '\n')
+        if workers == 1:
+            _init_book_worker(game, player)
+            results = map(_book_move, todo)
+            pool = None
+        else:
+            pool = multiprocessing.Pool(workers, initializer=_init_book_worker, initargs=(game, player))
+            results = pool.imap_unordered(_book_move, todo, chunksize=max(1, len(todo) // (workers * 64)))
+        try:
+            for h, move in results:
+                entries[h] = move
+                journal.write(repr((h, move)) + '\n')
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+    write_book(game, depth, {h: entries[h] for h, _ in positions}, path)
+    os.remove(journal_path)
+    return OpeningBook(path)
+
+
+# Opened books, by path, shared by every BookPlayer:
+books = {}
+
+
+def open_book(path):
+    """
+    open_book: Opens a book file, or returns the book already opened from it.
+    :param path: The path of the book file.
+    :return book: The OpeningBook.
+    """
+    if path not in books:
+        books[path] = OpeningBook(path)
+    return books[path]
+
+
+def cutoff_player(game, state, d=6):
+    """
+    cutoff_player: A player which searches d plies ahead with alphabeta_cutoff_search, for booking games too large to
+        search to the end; bind d with functools.partial.
+    """
+    return alphabeta_cutoff_search(state, game, d=d)
+
+
+class BookPlayer:
+    """
+    BookPlayer: A player which plays the move of an opening book while the game is in it, and otherwise the move of
+        the player it wraps. The book is opened on the first move, and is not copied with the player, so BookPlayers
+        can be sent to the worker processes of a tournament.
+    """
+
+    def __init__(self, path, player=alphabeta_player):
+        """
+        :param path: The path of the book file.
+        :param player: The player to fall back on once the game leaves the book.
+        """
+        self.path = path
+        self.player = player
+        self.name = 'book+{}'.format(name(player))
+        self.book = None
+
+    def __call__(self, game, state):
+        if self.book is None:
+            self.book = open_book(self.path)
+        move = self.book.lookup(game, state)
+        return move if move is not None else self.player(game, state)
+
+    def __getstate__(self):
+        return dict(self.__dict__, book=None)
+
+
+# The games which can be booked from the command line, by name:
+GAMES = {
+    'chopsticks': PackedChopsticksGame,
+    'connectfour': ConnectFour,
+    'bitboard-connectfour': BitboardConnectFour,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build an opening book.')
+    parser.add_argument('game', choices=sorted(GAMES), help='the game to book')
+    parser.add_argument('path', help='the book file to write')
+    parser.add_argument('--depth', type=int, default=6, help='the number of plies booked (default: 6)')
+    parser.add_argument('--search-depth', type=int,
+                        help='the depth each position is searched to (default: to the end of the game)')
+    parser.add_argument('--workers', type=int, help='the number of worker processes (default: one per CPU)')
+    args = parser.parse_args()
+    player = alphabeta_player if args.search_depth is None else partial(cutoff_player, d=args.search_depth)
+    book = build_book(GAMES[args.game](), args.path, args.depth, player, args.workers)
+    print('{}: {} positions to depth {}'.format(args.path, len(book), book.depth), file=sys.stderr)
+    book.close()
+
+
+if __name__ == '__main__':
+    main()
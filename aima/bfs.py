@@ -1,20 +1,50 @@
-from aima.node import Node
+from collections import deque
+from aima.node import Node, NodeArray
 from aima.utils import FIFOQueue
 
-def breadth_first_search(problem):
-    """[Figure 3.11]"""
+def breadth_first_search(problem, compact=False):
+    """[Figure 3.11]
+    States are marked as explored when they are generated rather than when
+    they are expanded, so a state already on the frontier is never queued
+    again and no scan of the frontier is needed to find out.
+    If compact, the search tree is kept in a NodeArray rather than as Nodes,
+    and only the Nodes of the solution are made, once it is found."""
     node = Node(problem.initial)
     if problem.goal_test(node.state):
         return node
+    if compact:
+        return compact_breadth_first_search(problem)
     frontier = FIFOQueue()
     frontier.append(node)
-    explored = set()
+    explored = {node.state}
     while frontier:
         node = frontier.pop()
-        explored.add(node.state)
         for child in node.expand(problem):
-            if child.state not in explored and child not in frontier:
+            if child.state not in explored:
                 if problem.goal_test(child.state):
                     return child
+                explored.add(child.state)
                 frontier.append(child)
     return None
+
+
+def compact_breadth_first_search(problem):
+    """breadth_first_search, keeping the search tree in a NodeArray. Nodes
+    are added to the array in the order they join the frontier, so the
+    frontier is just their states and the index of the node at its front."""
+    nodes = NodeArray()
+    frontier = deque([problem.initial])
+    index = 0  # The index of the node at the front of the frontier
+    explored = {problem.initial}
+    while frontier:
+        state = frontier.popleft()
+        for action in problem.actions(state):
+            child = problem.result(state, action)
+            if child not in explored:
+                child_index = nodes.add(index, action)
+                if problem.goal_test(child):
+                    return nodes.node(problem, child_index)
+                explored.add(child)
+                frontier.append(child)
+        index += 1
+    return None
@@ -1,114 +1,322 @@
 """Games, or Adversarial Search (Chapter 5)"""
 
-from collections import namedtuple
+import ast
+from collections import defaultdict, deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import copy
+import math
+import multiprocessing
+import os
 import random
+import time
 
-from aima.utils import argmax
+from aima.utils import argmax, name
 
 infinity = float('inf')
-GameState = namedtuple('GameState', 'to_move, utility, board, moves')
+# A state's key, if not None, identifies its position (see Game.state_key) and is
+# kept up to date by result, e.g. with ZobristKeys:
+GameState = namedtuple('GameState', 'to_move, utility, board, moves, key', defaults=(None,))
+# How a game ended: the utility of the final state to the first player, the number
+# of moves made, why the game ended ('terminal', 'max_plies' or 'repetition'), the
+# moves themselves, and the seconds each took to choose:
+GameResult = namedtuple('GameResult', 'utility, plies, reason, moves, move_times')
+# A position of BitboardTicTacToe or BitboardConnectFour: the squares of each player
+# as the bits of an int, and for ConnectFour the number of pieces in each column:
+BitboardState = namedtuple('BitboardState', 'to_move, utility, x, o, heights')
 
 # ______________________________________________________________________________
 # Minimax Search
 
 
-def minimax_decision(state, game):
+def minimax_decision(state, game, tt=None, stats=None):
     """Given a state in a game, calculate the best move by searching
-    forward all the way to the terminal states. [Figure 5.3]"""
-
+    forward all the way to the terminal states. [Figure 5.3]
+    If a TranspositionTable tt is given, positions already valued are
+    looked up rather than searched again. A cyclic game has lines of play
+    which never reach a terminal state, and is solved by retrograde_search
+    instead. If a SearchStats stats is given, the work done by the search is
+    recorded in it."""
+
+    if game.cyclic:
+        return retrograde_search(state, game, tt=tt, stats=stats)
+    if stats is not None:
+        game = stats.instrument(game)
     player = game.to_move(state)
 
-    def max_value(state):
+    def max_value(state, depth):
+        if stats is not None:
+            stats.nodes[depth] += 1
         if game.terminal_test(state):
             return game.utility(state, player)
+        if tt is not None:
+            key = game.state_key(state)
+            entry = tt.lookup(key)
+            if entry is not None:
+                if stats is not None:
+                    stats.tt_hits += 1
+                return entry.value
         v = -infinity
-        for a in game.actions(state):
-            v = max(v, min_value(game.result(state, a)))
+        for a in game.iter_actions(state):
+            v = max(v, min_value(game.result_unchecked(state, a), depth + 1))
+        if tt is not None:
+            tt.store(key, infinity, v, EXACT)
         return v
 
-    def min_value(state):
+    def min_value(state, depth):
+        if stats is not None:
+            stats.nodes[depth] += 1
         if game.terminal_test(state):
             return game.utility(state, player)
+        if tt is not None:
+            key = game.state_key(state)
+            entry = tt.lookup(key)
+            if entry is not None:
+                if stats is not None:
+                    stats.tt_hits += 1
+                return -entry.value
         v = infinity
-        for a in game.actions(state):
-            v = min(v, max_value(game.result(state, a)))
+        for a in game.iter_actions(state):
+            v = min(v, max_value(game.result_unchecked(state, a), depth + 1))
+        if tt is not None:
+            tt.store(key, infinity, -v, EXACT)
         return v
 
     # Body of minimax_decision:
+    if stats is not None:
+        stats.nodes[0] += 1
     return argmax(game.actions(state),
-                  key=lambda a: min_value(game.result(state, a)))
+                  key=lambda a: min_value(game.result_unchecked(state, a), 1))
 
 # ______________________________________________________________________________
 
 
-def alphabeta_search(state, game):
+def alphabeta_search(state, game, tt=None, stats=None):
     """Search game to determine best action; use alpha-beta pruning.
-    As in [Figure 5.7], this version searches all the way to the leaves."""
-
+    As in [Figure 5.7], this version searches all the way to the leaves.
+    If a TranspositionTable tt is given, the value or bound found for each
+    position is cached in it and consulted before searching it again. A
+    cyclic game has lines of play which never reach a leaf, and is solved by
+    retrograde_search instead. If a SearchStats stats is given, the work done
+    by the search is recorded in it."""
+
+    if game.cyclic:
+        return retrograde_search(state, game, tt=tt, stats=stats)
+    if stats is not None:
+        game = stats.instrument(game)
     player = game.to_move(state)
 
     # Functions used by alphabeta
-    def max_value(state, alpha, beta):
+    def max_value(state, alpha, beta, depth):
+        if stats is not None:
+            stats.nodes[depth] += 1
         if game.terminal_test(state):
             return game.utility(state, player)
+        if tt is not None:
+            key = game.state_key(state)
+            entry = tt.lookup(key)
+            if entry is not None:
+                if stats is not None:
+                    stats.tt_hits += 1
+                # Values are cached from the view of the player to move, which here is player:
+                if entry.flag == EXACT:
+                    return entry.value
+                elif entry.flag == LOWERBOUND:
+                    alpha = max(alpha, entry.value)
+                else:
+                    beta = min(beta, entry.value)
+                if alpha >= beta:
+                    return entry.value
+        alpha0 = alpha
         v = -infinity
-        for a in game.actions(state):
-            v = max(v, min_value(game.result(state, a), alpha, beta))
+        for a in game.iter_actions(state):
+            v = max(v, min_value(game.result_unchecked(state, a), alpha, beta, depth + 1))
             if v >= beta:
-                return v
+                if stats is not None:
+                    stats.cutoffs[depth] += 1
+                break
             alpha = max(alpha, v)
+        if tt is not None:
+            flag = (LOWERBOUND if v >= beta else
+                    UPPERBOUND if v <= alpha0 else EXACT)
+            tt.store(key, infinity, v, flag)
         return v
 
-    def min_value(state, alpha, beta):
+    def min_value(state, alpha, beta, depth):
+        if stats is not None:
+            stats.nodes[depth] += 1
         if game.terminal_test(state):
             return game.utility(state, player)
+        if tt is not None:
+            key = game.state_key(state)
+            entry = tt.lookup(key)
+            if entry is not None:
+                if stats is not None:
+                    stats.tt_hits += 1
+                # Values are cached from the view of the player to move, which here is the opponent:
+                if entry.flag == EXACT:
+                    return -entry.value
+                elif entry.flag == LOWERBOUND:
+                    beta = min(beta, -entry.value)
+                else:
+                    alpha = max(alpha, -entry.value)
+                if alpha >= beta:
+                    return -entry.value
+        beta0 = beta
         v = infinity
-        for a in game.actions(state):
-            v = min(v, max_value(game.result(state, a), alpha, beta))
+        for a in game.iter_actions(state):
+            v = min(v, max_value(game.result_unchecked(state, a), alpha, beta, depth + 1))
             if v <= alpha:
-                return v
+                if stats is not None:
+                    stats.cutoffs[depth] += 1
+                break
             beta = min(beta, v)
+        if tt is not None:
+            flag = (LOWERBOUND if v <= alpha else
+                    UPPERBOUND if v >= beta0 else EXACT)
+            tt.store(key, infinity, -v, flag)
         return v
 
     # Body of alphabeta_cutoff_search:
+    if stats is not None:
+        stats.nodes[0] += 1
     best_score = -infinity
     beta = infinity
     best_action = None
-    for a in game.actions(state):
-        v = min_value(game.result(state, a), best_score, beta)
+    for a in game.iter_actions(state):
+        v = min_value(game.result_unchecked(state, a), best_score, beta, 1)
         if v > best_score:
             best_score = v
             best_action = a
     return best_action
 
 
-def alphabeta_cutoff_search(state, game, d=4, cutoff_test=None, eval_fn=None):
+def retrograde_search(state, game, tt=None, stats=None):
+    """Solve every position reachable from state by retrograde analysis, and
+    return a best move: the quickest win, the slowest loss, or a move which
+    keeps the game drawn. This is how minimax_decision, alphabeta_search and
+    parallel_alphabeta_search search a cyclic game, where a position which
+    repeats one earlier on the line of play is a draw; a value found by
+    searching forward from a position then depends on the line of play
+    leading to it (the graph history interaction problem), so cannot be
+    cached. Terminal positions
+    are scored by the sign of their utility, and working back from them a
+    position is won if some move leads to a position lost for the opponent,
+    lost if every move leads to one won for the opponent, and otherwise
+    drawn (0), as either player can keep it from being decided. The game
+    must be two-player and zero-sum. If a TranspositionTable tt is given,
+    the value and best move of every position solved is stored in it (the
+    move is for the state the key was first reached by, if the game folds
+    symmetries into its keys). If a SearchStats stats is given, the
+    positions found are counted at their depth from state."""
+
+    if stats is not None:
+        game = stats.instrument(game)
+    # Every position reachable from state, numbered in the order found (breadth first), with the player to move in
+    #   each, its value and best move once solved, the plies to the end of the game from it, the (position, move) pairs
+    #   leading to it, and the number of its moves not yet shown to lead to a win for the opponent:
+    index = {game.state_key(state): 0}
+    keys, movers, values, best_moves, plies = [game.state_key(state)], [game.to_move(state)], [None], [None], [0]
+    predecessors, unresolved = [[]], [0]
+    frontier = deque([(state, 0)])
+    solved = deque()
+    while frontier:
+        state, depth = frontier.popleft()
+        node = index[game.state_key(state)]
+        if stats is not None:
+            stats.nodes[depth] += 1
+        if game.terminal_test(state):
+            utility = game.utility(state, movers[node])
+            values[node] = (utility > 0) - (utility < 0)
+            solved.append(node)
+            continue
+        for a in game.iter_actions(state):
+            child = game.result_unchecked(state, a)
+            key = game.state_key(child)
+            if key not in index:
+                index[key] = len(keys)
+                keys.append(key)
+                movers.append(game.to_move(child))
+                values.append(None)
+                best_moves.append(None)
+                plies.append(0)
+                predecessors.append([])
+                unresolved.append(0)
+                frontier.append((child, depth + 1))
+            predecessors[index[key]].append((node, a))
+            unresolved[node] += 1
+    # Positions are solved in order of the plies to the end of the game, so the first win found for a position is its
+    #   quickest, and the last move to be shown to lose is its slowest loss:
+    while solved:
+        child = solved.popleft()
+        for node, a in predecessors[child]:
+            if values[node] is not None:
+                continue
+            value = values[child] if movers[child] == movers[node] else -values[child]
+            if value > 0:
+                values[node] = 1
+            elif value < 0:
+                unresolved[node] -= 1
+                if unresolved[node]:
+                    continue
+                values[node] = -1
+            else:
+                continue
+            best_moves[node] = a
+            plies[node] = plies[child] + 1
+            solved.append(node)
+    # Whatever could not be decided is drawn, and its best move is one which leads to a position not lost for it:
+    for node, value in enumerate(values):
+        if value is None:
+            values[node] = 0
+    for child, value in enumerate(values):
+        for node, a in predecessors[child]:
+            if best_moves[node] is None and values[node] == 0 and value == 0:
+                best_moves[node] = a
+    if tt is not None:
+        for node, key in enumerate(keys):
+            if best_moves[node] is not None:
+                tt.store(key, infinity, values[node], EXACT, best_moves[node])
+    return best_moves[0]
+
+
+def alphabeta_cutoff_search(state, game, d=4, cutoff_test=None, eval_fn=None, stats=None):
     """Search game to determine best action; use alpha-beta pruning.
-    This version cuts off search and uses an evaluation function."""
+    This version cuts off search and uses an evaluation function. If a
+    SearchStats stats is given, the work done by the search is recorded in it."""
 
+    if stats is not None:
+        game = stats.instrument(game)
     player = game.to_move(state)
 
     # Functions used by alphabeta
     def max_value(state, alpha, beta, depth):
+        if stats is not None:
+            stats.nodes[depth] += 1
         if cutoff_test(state, depth):
             return eval_fn(state)
         v = -infinity
-        for a in game.actions(state):
-            v = max(v, min_value(game.result(state, a),
+        for a in game.iter_actions(state):
+            v = max(v, min_value(game.result_unchecked(state, a),
                                  alpha, beta, depth + 1))
             if v >= beta:
+                if stats is not None:
+                    stats.cutoffs[depth] += 1
                 return v
             alpha = max(alpha, v)
         return v
 
     def min_value(state, alpha, beta, depth):
+        if stats is not None:
+            stats.nodes[depth] += 1
         if cutoff_test(state, depth):
             return eval_fn(state)
         v = infinity
-        for a in game.actions(state):
-            v = min(v, max_value(game.result(state, a),
+        for a in game.iter_actions(state):
+            v = min(v, max_value(game.result_unchecked(state, a),
                                  alpha, beta, depth + 1))
             if v <= alpha:
+                if stats is not None:
+                    stats.cutoffs[depth] += 1
                 return v
             beta = min(beta, v)
         return v
@@ -119,16 +327,658 @@ def alphabeta_cutoff_search(state, game, d=4, cutoff_test=None, eval_fn=None):
                    (lambda state, depth: depth > d or
                     game.terminal_test(state)))
     eval_fn = eval_fn or (lambda state: game.utility(state, player))
+    if stats is not None:
+        stats.nodes[0] += 1
     best_score = -infinity
     beta = infinity
     best_action = None
-    for a in game.actions(state):
-        v = min_value(game.result(state, a), best_score, beta, 1)
+    for a in game.iter_actions(state):
+        v = min_value(game.result_unchecked(state, a), best_score, beta, 1)
         if v > best_score:
             best_score = v
             best_action = a
     return best_action
 
+
+class SearchTimeout(Exception):
+    """Raised within a search when its time budget has run out."""
+
+
+def iterative_deepening_search(state, game, time_limit=1.0, max_depth=None, eval_fn=None, tt=None):
+    """Search game with alpha-beta pruning to depth 1, then 2, 3 and so on
+    until time_limit seconds have passed or max_depth is reached, and return
+    the best move of the deepest search that completed. Each search tries
+    first the best move the one before found in a position (kept in a
+    TranspositionTable; tt if given), then the killer moves of its ply (the
+    last two moves to cause a cutoff at that ply), then the others in order
+    of their history score (how often and how deep they caused cutoffs).
+    eval_fn values cut off states for the player to move at the root, as in
+    alphabeta_cutoff_search. The search also stops once a depth is reached
+    at which no line of play was cut off, since deeper would be no different.
+    The search is written in negamax form, so as with TranspositionTable the
+    game must be two-player and zero-sum."""
+
+    player = game.to_move(state)
+    eval_fn = eval_fn or (lambda state: game.utility(state, player))
+    if tt is None:
+        tt = TranspositionTable()
+    deadline = time.perf_counter() + time_limit
+    killers = defaultdict(list)  # The last two moves to cause a cutoff, by ply
+    history = defaultdict(int)  # Cutoff scores, by (player to move, move)
+    path = set()  # The positions on the line of play being searched
+    nodes = 0
+    horizon = False  # Whether any line of play was cut off by the depth limit
+
+    def ordered(state, ply, best_move):
+        """The moves of state, most promising first."""
+        to_move = game.to_move(state)
+
+        def priority(move):
+            if move == best_move:
+                return 2, 0
+            elif move in killers[ply]:
+                return 1, 0
+            return 0, history[to_move, move]
+
+        # Every move is needed to rank them, but the sort is stable, so moves the game ranks alike keep its order:
+        return sorted(game.iter_actions(state), key=priority, reverse=True)
+
+    def value(state, alpha, beta, ply, depth):
+        """The value of state to the player to move, searching depth more plies."""
+        nonlocal nodes, horizon
+        nodes += 1
+        if nodes % 256 == 0 and time.perf_counter() > deadline:
+            raise SearchTimeout
+        to_move = game.to_move(state)
+        if game.terminal_test(state):
+            return game.utility(state, to_move)
+        if depth == 0:
+            horizon = True
+            v = eval_fn(state)
+            return v if to_move == player else -v
+        key = game.state_key(state)
+        if key in path:
+            return 0
+        entry = tt.lookup(key)
+        best_move = None
+        if entry is not None:
+            best_move = entry.move
+            if entry.depth >= depth:
+                if entry.flag == EXACT:
+                    return entry.value
+                elif entry.flag == LOWERBOUND:
+                    alpha = max(alpha, entry.value)
+                else:
+                    beta = min(beta, entry.value)
+                if alpha >= beta:
+                    return entry.value
+        alpha0 = alpha
+        path.add(key)
+        v = -infinity
+        for move in ordered(state, ply, best_move):
+            child_value = -value(game.result_unchecked(state, move), -beta, -alpha, ply + 1, depth - 1)
+            if child_value > v:
+                v, best_move = child_value, move
+            if v >= beta:
+                if move not in killers[ply]:
+                    killers[ply] = [move] + killers[ply][:1]
+                history[to_move, move] += depth * depth
+                break
+            alpha = max(alpha, v)
+        path.remove(key)
+        flag = (LOWERBOUND if v >= beta else
+                UPPERBOUND if v <= alpha0 else EXACT)
+        tt.store(key, depth, v, flag, best_move)
+        return v
+
+    # Body of iterative_deepening_search:
+    moves = game.actions(state)
+    if not moves:
+        return None
+    best_move = moves[0]
+    root_key = game.state_key(state)
+    depth = 0
+    while max_depth is None or depth < max_depth:
+        depth += 1
+        horizon = False
+        path.clear()
+        path.add(root_key)
+        try:
+            alpha, iteration_best = -infinity, None
+            for move in ordered(state, 0, best_move):
+                v = -value(game.result_unchecked(state, move), -infinity, -alpha, 1, depth - 1)
+                if iteration_best is None or v > alpha:
+                    alpha, iteration_best = v, move
+        except SearchTimeout:
+            break
+        best_move = iteration_best
+        if not horizon:
+            break
+    return best_move
+
+# ______________________________________________________________________________
+# Monte Carlo Tree Search
+
+
+class MCT_Node:
+    """A node of a Monte Carlo search tree. U is the total utility of the
+    playouts through the node, to the player who moved into it, and N the
+    number of those playouts. children maps each expanded move to its node,
+    and untried holds the moves not yet expanded."""
+
+    __slots__ = ('parent', 'state', 'U', 'N', 'children', 'untried')
+
+    def __init__(self, parent=None, state=None, U=0, N=0):
+        self.parent = parent
+        self.state = state
+        self.U = U
+        self.N = N
+        self.children = {}
+        self.untried = None
+
+
+def ucb(n, C=1.4):
+    """The upper confidence bound of node n, by which UCT selects children."""
+    return infinity if n.N == 0 else n.U / n.N + C * math.sqrt(math.log(n.parent.N) / n.N)
+
+
+def monte_carlo_tree_search(state, game, n_playouts=1000, time_limit=None, policy=None,
+                            C=1.4, max_playout=200, root=None):
+    """Search game by Monte Carlo tree search with UCT selection, and return
+    the most visited move. Playouts are made until n_playouts have been made
+    or time_limit seconds have passed, whichever is first (either may be
+    None). Each selects a path down the tree by ucb, expands one new node and
+    plays the game out from it with policy, a player such as random_player
+    (the default). A line of play from state longer than max_playout moves,
+    counting those down the tree, is scored as a draw (0), since in a cyclic
+    game it may never end. The search grows root
+    if given, an MCT_Node of state from an earlier search (see MCTSPlayer)."""
+
+    if n_playouts is None and time_limit is None:
+        raise ValueError('monte_carlo_tree_search needs n_playouts or a time_limit')
+    policy = policy or random_player
+    deadline = None if time_limit is None else time.perf_counter() + time_limit
+    root = root or MCT_Node(state=state)
+
+    def select(n):
+        """Descend from n to a node that has moves left to expand, or is
+        terminal, or is max_playout moves down; return it and its depth."""
+        depth = 0
+        while not n.untried and n.children and depth < max_playout:
+            n = max(n.children.values(), key=lambda child: ucb(child, C))
+            depth += 1
+        return n, depth
+
+    def expand(n):
+        """Add a child to n for one of its untried moves."""
+        if n.untried is None:
+            n.untried = [] if game.terminal_test(n.state) else list(game.actions(n.state))
+            random.shuffle(n.untried)
+        if not n.untried:
+            return n
+        move = n.untried.pop()
+        child = MCT_Node(parent=n, state=game.result_unchecked(n.state, move))
+        n.children[move] = child
+        return child
+
+    def simulate(state, moves_left):
+        """Play the game out from state; return the final state, or None for a draw."""
+        for _ in range(moves_left):
+            if game.terminal_test(state):
+                return state
+            state = game.result_unchecked(state, policy(game, state))
+        return state if game.terminal_test(state) else None
+
+    def backprop(n, final):
+        """Add the outcome of a playout ending in final to n and its ancestors."""
+        utilities = {}
+        while n.parent is not None:
+            mover = game.to_move(n.parent.state)
+            if mover not in utilities:
+                utilities[mover] = 0 if final is None else game.utility(final, mover)
+            n.U += utilities[mover]
+            n.N += 1
+            n = n.parent
+        n.N += 1
+
+    # Body of monte_carlo_tree_search:
+    playouts = 0
+    while ((n_playouts is None or playouts < n_playouts) and
+           (deadline is None or time.perf_counter() < deadline)):
+        leaf, depth = select(root)
+        if depth < max_playout:
+            child = expand(leaf)
+            if child is not leaf:
+                leaf, depth = child, depth + 1
+        backprop(leaf, simulate(leaf.state, max_playout - depth))
+        playouts += 1
+    if not root.children:
+        return None
+    return max(root.children, key=lambda move: root.children[move].N)
+
+
+class MCTSPlayer:
+    """A player that chooses moves by monte_carlo_tree_search, keeping the
+    tree between moves: the subtree under its last move and the opponent's
+    reply becomes the root of its next search, so earlier playouts are not
+    wasted. Keyword arguments are passed on to monte_carlo_tree_search. Use
+    a new player for each game."""
+
+    def __init__(self, **search_args):
+        self.search_args = search_args
+        self.root = None
+
+    def __call__(self, game, state):
+        self.root = self.find(game, state)
+        move = monte_carlo_tree_search(state, game, root=self.root, **self.search_args)
+        # Keep the subtree of the chosen move for the next call:
+        self.root = self.root.children.get(move)
+        return move
+
+    def find(self, game, state):
+        """Return the node of state below the kept subtree, or a new root."""
+        if self.root is not None:
+            key = game.state_key(state)
+            candidates = [self.root] + list(self.root.children.values())
+            for node in candidates:
+                if game.state_key(node.state) == key:
+                    node.parent = None
+                    return node
+        return MCT_Node(state=state)
+
+
+# ______________________________________________________________________________
+# Parallel Search
+
+
+def alphabeta_value(state, game, alpha=-infinity, beta=infinity, tt=None, path=None):
+    """Return the value of state to the player to move in it, searching all
+    the way to the leaves with alpha-beta pruning. As usual a value at or
+    below alpha is only an upper bound on the true value, and one at or above
+    beta only a lower bound. If a TranspositionTable tt is given, the value or
+    bound found for each position is cached in it. In a cyclic game a table is
+    always used, and a position that repeats one on the line of play is
+    scored as a draw (0); path holds the state keys of the line of play
+    leading to state. The search is written in negamax form, so as with
+    TranspositionTable the game must be two-player and zero-sum."""
+
+    if tt is None and game.cyclic:
+        tt = TranspositionTable()
+    path = set() if path is None else path
+
+    def value(state, alpha, beta):
+        to_move = game.to_move(state)
+        if game.terminal_test(state):
+            return game.utility(state, to_move)
+        if tt is not None:
+            key = game.state_key(state)
+            if key in path:
+                return 0
+            entry = tt.lookup(key)
+            if entry is not None:
+                if entry.flag == EXACT:
+                    return entry.value
+                elif entry.flag == LOWERBOUND:
+                    alpha = max(alpha, entry.value)
+                else:
+                    beta = min(beta, entry.value)
+                if alpha >= beta:
+                    return entry.value
+            path.add(key)
+        alpha0 = alpha
+        v = -infinity
+        for a in game.iter_actions(state):
+            v = max(v, -value(game.result_unchecked(state, a), -beta, -alpha))
+            if v >= beta:
+                break
+            alpha = max(alpha, v)
+        if tt is not None:
+            path.remove(key)
+            flag = (LOWERBOUND if v >= beta else
+                    UPPERBOUND if v <= alpha0 else EXACT)
+            tt.store(key, infinity, v, flag)
+        return v
+
+    return value(state, alpha, beta)
+
+
+# The pools of worker processes the parallel searches are run in, made on first
+# use and kept for the searches after, by process and number of workers, each
+# with the best value found so far by the workers of a
+# parallel_alphabeta_search:
+_search_pools = {}
+_shared_alpha = None  # In a worker, that best value
+
+
+def _init_search_worker(shared_alpha):
+    global _shared_alpha
+    _shared_alpha = shared_alpha
+
+
+def _search_pool(workers):
+    """Return the (executor, shared_alpha) of the pool of worker processes
+    this process searches with, making it if need be; starting processes
+    takes far longer than most searches."""
+    pool = (os.getpid(), workers)
+    if pool not in _search_pools:
+        shared_alpha = multiprocessing.Value('d', -infinity)
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_search_worker,
+                                       initargs=(shared_alpha,))
+        _search_pools[pool] = executor, shared_alpha
+    return _search_pools[pool]
+
+
+def _alphabeta_root_move(game, state, move):
+    """Return the value to the player to move of making move in state, and
+    the alpha the value was found with; the value is exact if above it."""
+    player = game.to_move(state)
+    child = game.result_unchecked(state, move)
+    if game.terminal_test(child):
+        return game.utility(child, player), -infinity
+    alpha = -infinity
+    v = infinity
+    for reply in game.iter_actions(child):
+        # Another worker may have found a better move since the last reply was searched:
+        alpha = max(alpha, _shared_alpha.value)
+        v = min(v, alphabeta_value(game.result_unchecked(child, reply), game, alpha, v))
+        if v <= alpha:
+            return v, alpha
+    with _shared_alpha.get_lock():
+        _shared_alpha.value = max(_shared_alpha.value, v)
+    return v, alpha
+
+
+def parallel_alphabeta_search(state, game, workers=None):
+    """Search game to determine best action with alphabeta_value, but with
+    the moves of state searched in parallel by a pool of worker processes
+    (os.cpu_count() of them by default). The best value found so far is
+    shared between the workers and each uses it as alpha, so a move searched
+    after a good one has been found is cut off just as it is serially. The
+    pool is kept for later searches with as many workers, so a process
+    should make only one parallel search at a time. The game and its states
+    must be picklable. As for alphabeta_search, a cyclic game is solved by
+    retrograde_search instead: the values found in a worker would depend on
+    the lines of play it searched, and so on how the moves were shared out."""
+
+    if game.cyclic:
+        return retrograde_search(state, game)
+    moves = game.actions(state)
+    if not moves:
+        return None
+    executor, shared_alpha = _search_pool(workers or os.cpu_count())
+    shared_alpha.value = -infinity
+    futures = [executor.submit(_alphabeta_root_move, game, state, move) for move in moves]
+    best_move, best_value = moves[0], -infinity
+    for move, future in zip(moves, futures):
+        v, alpha = future.result()
+        # A value at or below its alpha is no better than a move already found:
+        if alpha < v and v > best_value:
+            best_move, best_value = move, v
+    return best_move
+
+
+def _mcts_root_visits(game, state, seed, search_args):
+    """Grow a Monte Carlo search tree from state; return the visits of each move."""
+    random.seed(seed)
+    root = MCT_Node(state=state)
+    monte_carlo_tree_search(state, game, root=root, **search_args)
+    return {move: child.N for move, child in root.children.items()}
+
+
+def parallel_monte_carlo_tree_search(state, game, workers=None, n_playouts=1000, time_limit=None, **search_args):
+    """Root-parallel Monte Carlo tree search: each of a pool of worker
+    processes (os.cpu_count() by default) grows its own tree from state, with
+    the n_playouts split between them and each searching for at most
+    time_limit seconds, and the move visited most over all of the trees is
+    returned. The pool is kept for later searches, as for
+    parallel_alphabeta_search. Other arguments are as for
+    monte_carlo_tree_search, and like the game must be picklable."""
+
+    workers = workers or os.cpu_count()
+    if n_playouts is not None:
+        n_playouts = -(-n_playouts // workers)
+    search_args = dict(search_args, n_playouts=n_playouts, time_limit=time_limit)
+    visits = defaultdict(int)
+    executor, _ = _search_pool(workers)
+    futures = [executor.submit(_mcts_root_visits, game, state, random.getrandbits(64), search_args)
+               for _ in range(workers)]
+    for future in futures:
+        for move, n in future.result().items():
+            visits[move] += n
+    if not visits:
+        return None
+    return max(visits, key=visits.get)
+
+
+# ______________________________________________________________________________
+# Transposition Tables
+
+
+EXACT, LOWERBOUND, UPPERBOUND = 'exact', 'lower', 'upper'
+TTEntry = namedtuple('TTEntry', 'key, depth, value, flag, move')
+
+
+class TranspositionTable:
+    """A cache of search results, keyed by Game.state_key, so that a position
+    reached by several move orders is only searched once. Each entry records
+    the value found, whether it is EXACT or only a LOWERBOUND or UPPERBOUND
+    (after an alpha-beta cutoff), the depth it was searched to and optionally
+    the best move. Values are kept from the point of view of the player to
+    move, so entries can be shared by searches made for either player; this
+    assumes a two-player, zero-sum game, as are all the games here.
+
+    With maxsize=None the table grows without bound. Otherwise it has
+    maxsize slots, chosen by hashing the key, and replace decides which entry
+    keeps a slot two keys contend for: 'always' keeps the newest entry and
+    'depth' keeps the one searched deeper (the newest on a tie). The hits,
+    misses and stores counters report how well the table is doing."""
+
+    def __init__(self, maxsize=None, replace='depth'):
+        if replace not in ('always', 'depth'):
+            raise ValueError("replace must be 'always' or 'depth'")
+        self.maxsize = maxsize
+        self.replace = replace
+        self.table = {}
+        self.hits = self.misses = self.stores = 0
+
+    def slot(self, key):
+        """Return the slot of the table key is kept in."""
+        return key if self.maxsize is None else hash(key) % self.maxsize
+
+    def lookup(self, key):
+        """Return the TTEntry for key, or None if there is none."""
+        entry = self.table.get(self.slot(key))
+        if entry is not None and entry.key == key:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return None
+
+    def store(self, key, depth, value, flag=EXACT, move=None):
+        """Record the result of searching key to depth, unless the replacement
+        policy prefers the entry already in its slot."""
+        slot = self.slot(key)
+        old = self.table.get(slot)
+        if old is not None and self.replace == 'depth' and old.depth > depth:
+            return
+        self.table[slot] = TTEntry(key, depth, value, flag, move)
+        self.stores += 1
+
+    def clear(self):
+        """Remove every entry and reset the counters."""
+        self.table.clear()
+        self.hits = self.misses = self.stores = 0
+
+    def __len__(self):
+        return len(self.table)
+
+    def __repr__(self):
+        return '<TranspositionTable: {} entries, {} hits, {} misses, {} stores>'.format(
+            len(self), self.hits, self.misses, self.stores)
+
+
+# ______________________________________________________________________________
+# Search Statistics
+
+
+class SearchStats:
+    """A record of the work done by a search, for tuning searchers and
+    catching regressions; pass one as the stats argument of a searcher.
+    nodes and cutoffs count the nodes visited and the beta cutoffs made at
+    each depth (the root being depth 0), terminals the terminal states
+    reached, tt_hits the positions found in a TranspositionTable, moves the
+    moves generated by actions and iter_actions (those a cutoff spared
+    iter_actions from generating are not counted), and time and calls the
+    seconds spent in and the number of calls made to the game's actions
+    (or iter_actions), result and terminal_test. A searcher given no stats
+    pays only for one test per node."""
+
+    def __init__(self):
+        self.nodes = defaultdict(int)
+        self.cutoffs = defaultdict(int)
+        self.terminals = 0
+        self.tt_hits = 0
+        self.moves = 0
+        self.time = defaultdict(float)
+        self.calls = defaultdict(int)
+
+    def instrument(self, game):
+        """Return game, timing its calls into this record."""
+        return InstrumentedGame(game, self)
+
+    @property
+    def total_nodes(self):
+        return sum(self.nodes.values())
+
+    @property
+    def max_depth(self):
+        return max(self.nodes, default=0)
+
+    @property
+    def effective_branching_factor(self):
+        """The branching factor b* a uniform tree as deep as the search
+        would need to hold as many nodes, so N = 1 + b* + ... + b*^d."""
+        n, d = self.total_nodes, self.max_depth
+        if d == 0:
+            return 0
+        # b*^d <= N, which bounds the bisection:
+        lo, hi = 0.0, n ** (1 / d)
+        for _ in range(100):
+            b = (lo + hi) / 2
+            if sum(b ** i for i in range(d + 1)) < n:
+                lo = b
+            else:
+                hi = b
+        return lo
+
+    def __repr__(self):
+        return ('<SearchStats: {} nodes to depth {}, {} terminals, {} cutoffs, {} tt hits, {} moves, '
+                'b* {:.2f}>'.format(self.total_nodes, self.max_depth, self.terminals, sum(self.cutoffs.values()),
+                                    self.tt_hits, self.moves, self.effective_branching_factor))
+
+
+class InstrumentedGame:
+    """A game that behaves exactly like the game it wraps, but records the
+    time spent in and the calls made to its actions, result and
+    terminal_test in a SearchStats, and counts the terminal states found
+    and the moves generated."""
+
+    def __init__(self, game, stats):
+        self.game = game
+        self.stats = stats
+
+    def __getattr__(self, attr):
+        return getattr(self.game, attr)
+
+    def actions(self, state):
+        start = time.perf_counter()
+        moves = self.game.actions(state)
+        self.stats.time['actions'] += time.perf_counter() - start
+        self.stats.calls['actions'] += 1
+        self.stats.moves += len(moves)
+        return moves
+
+    def iter_actions(self, state):
+        # Time is only spent in the game's iterator as each move is drawn from it, so each draw is timed:
+        stats = self.stats
+        stats.calls['actions'] += 1
+        moves = self.game.iter_actions(state)
+        while True:
+            start = time.perf_counter()
+            move = next(moves, None)
+            stats.time['actions'] += time.perf_counter() - start
+            if move is None:
+                return
+            stats.moves += 1
+            yield move
+
+    def result(self, state, move):
+        start = time.perf_counter()
+        child = self.game.result(state, move)
+        self.stats.time['result'] += time.perf_counter() - start
+        self.stats.calls['result'] += 1
+        return child
+
+    def result_unchecked(self, state, move):
+        start = time.perf_counter()
+        child = self.game.result_unchecked(state, move)
+        self.stats.time['result'] += time.perf_counter() - start
+        self.stats.calls['result'] += 1
+        return child
+
+    def terminal_test(self, state):
+        start = time.perf_counter()
+        terminal = self.game.terminal_test(state)
+        self.stats.time['terminal_test'] += time.perf_counter() - start
+        self.stats.calls['terminal_test'] += 1
+        if terminal:
+            self.stats.terminals += 1
+        return terminal
+
+    def __repr__(self):
+        return repr(self.game)
+
+
+# ______________________________________________________________________________
+# Zobrist Hashing
+
+
+class ZobristKeys:
+    """Random 64-bit keys for hashing positions [Zobrist 1970]. The hash
+    of a position is the XOR of the keys of the (feature, value) pairs on
+    its board, e.g. (square, piece), and of the key of the player to move,
+    so a move updates it in O(1) by XORing out what it changes and XORing
+    in what replaces it. Distinct positions collide with probability 2**-64
+    per pair. The keys are drawn from a generator seeded with seed, so that
+    every process hashes positions alike."""
+
+    def __init__(self, features, values, players, seed=0):
+        rng = random.Random(seed)
+        self.keys = {(feature, value): rng.getrandbits(64) for feature in features for value in values}
+        self.player_keys = {player: rng.getrandbits(64) for player in players}
+
+    def hash(self, items, to_move):
+        """Return the hash of a position from scratch, given its board's
+        (feature, value) items and the player to move."""
+        h = self.player_keys[to_move]
+        for item in items:
+            h ^= self.keys[item]
+        return h
+
+    def update(self, h, feature, old, new):
+        """Return hash h after feature changes from value old to new; None
+        stands for a feature, like an empty square, that has no value."""
+        if old is not None:
+            h ^= self.keys[feature, old]
+        if new is not None:
+            h ^= self.keys[feature, new]
+        return h
+
+    def pass_turn(self, h, player, next_player):
+        """Return hash h after the turn passes from player to next_player."""
+        return h ^ self.player_keys[player] ^ self.player_keys[next_player]
+
+
 # ______________________________________________________________________________
 # Players for Games
 
@@ -140,9 +990,10 @@ def query_player(game, state):
     print("available moves: {}".format(game.actions(state)))
     print("")
     move_string = input('Your move? ')
+    # Moves are read as Python literals, such as (1, 2); anything else, such as a bare name, is taken as a string:
     try:
-        move = eval(move_string)
-    except NameError:
+        move = ast.literal_eval(move_string)
+    except (ValueError, SyntaxError):
         move = move_string
     return move
 
@@ -156,6 +1007,136 @@ def alphabeta_player(game, state):
     return alphabeta_search(state, game)
 
 
+def iterative_deepening_player(game, state):
+    return iterative_deepening_search(state, game)
+
+
+def mcts_player(game, state):
+    return monte_carlo_tree_search(state, game)
+
+
+def parallel_alphabeta_player(game, state):
+    return parallel_alphabeta_search(state, game)
+
+
+def parallel_mcts_player(game, state):
+    return parallel_monte_carlo_tree_search(state, game)
+
+
+# ______________________________________________________________________________
+# Tournaments
+
+
+TournamentGame = namedtuple('TournamentGame', 'first, second, utility, length, reason, move_times')
+TournamentResult = namedtuple('TournamentResult',
+                              'players, wins, draws, losses, games, average_length, latency')
+
+
+def _play_tournament_game(task):
+    """Play one game of a tournament, in a fresh copy of the game and players."""
+    game_factory, players, first, second, seed, max_plies, repetitions = task
+    random.seed(seed)
+    players = copy.deepcopy((players[first], players[second]))
+    result = game_factory().play_game(*players, max_plies=max_plies, repetitions=repetitions, quiet=True)
+    move_times = tuple(result.move_times[i::len(players)] for i in range(len(players)))
+    return TournamentGame(first, second, result.utility, result.plies, result.reason, move_times)
+
+
+def tournament_games(game_factory, players, n_games, workers=None, seed=None, max_plies=1000,
+                     repetitions=None):
+    """Generate the TournamentGame record of each game of a round-robin
+    tournament, in the order they finish. Every player plays n_games games
+    moving first against every other player; game_factory() makes the game
+    for each. Games are shared between a pool of workers processes
+    (os.cpu_count() by default; 1 plays them in this process), so the game
+    factory and players must be picklable, and each game gets its own copy
+    of the players. Each game is seeded from seed, so a tournament can be
+    replayed exactly whatever the number of workers. Games are drawn after
+    max_plies moves or repetitions repeats of a position (see
+    Game.play_game)."""
+    rng = random.Random(seed)
+    tasks = [(game_factory, players, first, second, rng.getrandbits(64), max_plies, repetitions)
+             for first in range(len(players)) for second in range(len(players)) if first != second
+             for _ in range(n_games)]
+    workers = workers or os.cpu_count()
+    if workers == 1:
+        yield from map(_play_tournament_game, tasks)
+        return
+    with multiprocessing.Pool(workers) as pool:
+        yield from pool.imap_unordered(_play_tournament_game, tasks,
+                                       chunksize=max(1, len(tasks) // (workers * 16)))
+
+
+class LatencyHistogram:
+    """Counts of durations in logarithmic buckets, 100 to a decade, so that
+    the percentiles of millions of timings can be kept in a few kilobytes
+    and are accurate to within about 2.3%."""
+
+    resolution = 100
+
+    def __init__(self):
+        self.counts = defaultdict(int)
+        self.n = 0
+
+    def add(self, seconds):
+        self.counts[math.floor(math.log10(max(seconds, 1e-9)) * self.resolution)] += 1
+        self.n += 1
+
+    def percentile(self, p):
+        """Return (an upper bound on) the p-th percentile, in seconds."""
+        rank = p / 100 * self.n
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                return 10 ** ((bucket + 1) / self.resolution)
+        return None
+
+
+def run_tournament(game_factory, players, n_games, workers=None, seed=None, max_plies=1000,
+                   repetitions=None, on_result=None, percentiles=(50, 90, 99)):
+    """Play a round-robin tournament between players (see tournament_games)
+    and return a TournamentResult. wins, draws and losses are matrices, as
+    dicts of dicts by player name, of the results of the row player against
+    the column player with either moving first; games counts the games of
+    each pair and average_length is the mean number of moves in a game.
+    latency maps each player's name to the given percentiles of the time it
+    took to move, in seconds. on_result, if given, is called with each
+    TournamentGame as it finishes. Players of the same name, such as two
+    MCTSPlayers, are told apart by a suffix: 'MCTSPlayer', 'MCTSPlayer#2'."""
+    names = []
+    for player in players:
+        player_name, n = name(player), 1
+        while player_name in names:
+            n += 1
+            player_name = '{}#{}'.format(name(player), n)
+        names.append(player_name)
+    wins, draws, losses, games = ({a: {b: 0 for b in names if b != a} for a in names} for _ in range(4))
+    histograms = {a: LatencyHistogram() for a in names}
+    total_length = 0
+    n = 0
+    for record in tournament_games(game_factory, players, n_games, workers, seed, max_plies, repetitions):
+        if on_result is not None:
+            on_result(record)
+        first, second = names[record.first], names[record.second]
+        winner, loser = (first, second) if record.utility > 0 else (second, first)
+        if record.utility == 0:
+            draws[first][second] += 1
+            draws[second][first] += 1
+        else:
+            wins[winner][loser] += 1
+            losses[loser][winner] += 1
+        games[first][second] += 1
+        games[second][first] += 1
+        for player, times in zip((first, second), record.move_times):
+            for seconds in times:
+                histograms[player].add(seconds)
+        total_length += record.length
+        n += 1
+    latency = {a: {p: histograms[a].percentile(p) for p in percentiles} for a in names}
+    return TournamentResult(names, wins, draws, losses, games, total_length / n if n else 0, latency)
+
+
 # ______________________________________________________________________________
 # Some Sample Games
 
@@ -167,16 +1148,36 @@ class Game:
     result, utility, and terminal_test. You may override display and
     successors or you can inherit their default methods. You will also
     need to set the .initial attribute to the initial state; this can
-    be done in the constructor."""
+    be done in the constructor. Set cyclic to True if positions can recur
+    during a game; searchers then score a repeated position as a draw."""
+
+    cyclic = False
 
     def actions(self, state):
         """Return a list of the allowable moves at this point."""
         raise NotImplementedError
 
+    def iter_actions(self, state):
+        """Return an iterator over the allowable moves at this point, most
+        promising first. The alpha-beta searchers draw moves from it one at
+        a time, so a game may override this with a generator that produces
+        its moves in stages (e.g. captures, then quiet moves), and the moves
+        after a cutoff are then never generated at all. It must yield the
+        same moves as actions, though not necessarily in the same order; by
+        default it iterates over actions."""
+        return iter(self.actions(state))
+
     def result(self, state, move):
         """Return the state that results from making a move from a state."""
         raise NotImplementedError
 
+    def result_unchecked(self, state, move):
+        """Return the state that results from a move known to be legal, as
+        the searchers' moves always are. Games may override this with a
+        faster version that skips validating the move and computing what
+        the searchers do not use; by default it is result."""
+        return self.result(state, move)
+
     def utility(self, state, player):
         """Return the value of this final state to player."""
         raise NotImplementedError
@@ -189,6 +1190,11 @@ class Game:
         """Return the player whose move it is in this state."""
         return state.to_move
 
+    def state_key(self, state):
+        """Return a hashable key that identifies state, including the player
+        to move, e.g. for a TranspositionTable. By default the state itself."""
+        return state
+
     def display(self, state):
         """Print or otherwise display the state."""
         print(state)
@@ -196,20 +1202,46 @@ class Game:
     def __repr__(self):
         return '<{}>'.format(self.__class__.__name__)
 
-    def play_game(self, *players):
-        """Play an n-person, move-alternating game."""
+    def play_game(self, *players, max_plies=None, repetitions=None, quiet=False):
+        """Play an n-person, move-alternating game and return a GameResult.
+        The game is drawn once max_plies moves have been made, or when a
+        position (by state_key) occurs for the repetitions-th time. If quiet,
+        the final state is not displayed and an invalid move raises
+        ValueError instead of asking the player again, so that unattended
+        games between programs always end."""
         state = self.initial
+        # Positions are only keyed when repetitions are counted, so games whose states cannot be keyed can still be
+        #   played:
+        history = defaultdict(int)
+        if repetitions is not None:
+            history[self.state_key(state)] += 1
+        moves = []
+        move_times = []
         while True:
             for player in players:
+                if max_plies is not None and len(moves) >= max_plies:
+                    return GameResult(0, len(moves), 'max_plies', moves, move_times)
+                start = time.perf_counter()
                 move = player(self, state)
+                move_times.append(time.perf_counter() - start)
                 # CLC: Modified to require the player to choose another move if invalid:
-                while move not in state.moves:
+                while move not in self.actions(state):
+                    if quiet:
+                        raise ValueError('{} made the invalid move {!r} in {}'.format(name(player), move, self))
                     print("Invalid move, try again.\n")
                     move = player(self, state)
+                moves.append(move)
                 state = self.result(state, move)
                 if self.terminal_test(state):
-                    self.display(state)
-                    return self.utility(state, self.to_move(self.initial))
+                    if not quiet:
+                        self.display(state)
+                    return GameResult(self.utility(state, self.to_move(self.initial)), len(moves), 'terminal',
+                                      moves, move_times)
+                if repetitions is not None:
+                    key = self.state_key(state)
+                    history[key] += 1
+                    if history[key] >= repetitions:
+                        return GameResult(0, len(moves), 'repetition', moves, move_times)
 
 
 class Fig52Game(Game):
@@ -248,7 +1280,7 @@ class Fig52Extended(Game):
     utils = dict()
 
     def actions(self, state):
-        return sorted(list(self.succs.get(state, {}).keys()))
+        return sorted(self.succs.get(state, {}))
 
     def result(self, state, move):
         return self.succs[state][move]
@@ -269,7 +1301,8 @@ class TicTacToe(Game):
     """Play TicTacToe on an h x v board, with Max (first player) playing 'X'.
     A state has the player to move, a cached utility, a list of moves in
     the form of a list of (x, y) positions, and a board, in the form of
-    a dict of {(x, y): Player} entries, where Player is 'X' or 'O'."""
+    a dict of {(x, y): Player} entries, where Player is 'X' or 'O'. Its
+    key is the Zobrist hash of the position, updated by each move."""
 
     def __init__(self, h=3, v=3, k=3):
         self.h = h
@@ -277,12 +1310,21 @@ class TicTacToe(Game):
         self.k = k
         moves = [(x, y) for x in range(1, h + 1)
                  for y in range(1, v + 1)]
-        self.initial = GameState(to_move='X', utility=0, board={}, moves=moves)
+        self.zobrist = ZobristKeys(moves, ('X', 'O'), ('X', 'O'))
+        self.initial = GameState(to_move='X', utility=0, board={}, moves=moves,
+                                 key=self.zobrist.hash((), 'X'))
+        # The squares nearest the centre lie on the most lines, so they are tried first:
+        self.move_order = sorted(moves, key=lambda move: (2 * move[0] - h - 1) ** 2 + (2 * move[1] - v - 1) ** 2)
 
     def actions(self, state):
         """Legal moves are any square not yet taken."""
         return state.moves
 
+    def iter_actions(self, state):
+        """The squares not yet taken, nearest the centre first."""
+        board = state.board
+        return (move for move in self.move_order if move not in board)
+
     def result(self, state, move):
         if move not in state.moves:
             return state  # Illegal move has no effect
@@ -290,9 +1332,12 @@ class TicTacToe(Game):
         board[move] = state.to_move
         moves = list(state.moves)
         moves.remove(move)
-        return GameState(to_move=('O' if state.to_move == 'X' else 'X'),
+        to_move = 'O' if state.to_move == 'X' else 'X'
+        key = self.zobrist.update(self.state_key(state), move, None, state.to_move)
+        return GameState(to_move=to_move,
                          utility=self.compute_utility(board, move, state.to_move),
-                         board=board, moves=moves)
+                         board=board, moves=moves,
+                         key=self.zobrist.pass_turn(key, state.to_move, to_move))
 
     def utility(self, state, player):
         """Return the value to player; 1 for win, -1 for loss, 0 otherwise."""
@@ -302,6 +1347,13 @@ class TicTacToe(Game):
         """A state is terminal if it is won or there are no empty squares."""
         return state.utility != 0 or len(state.moves) == 0
 
+    def state_key(self, state):
+        """The board dict is unhashable, so key on the Zobrist hash of the
+        position; hashed from scratch for states not made by result."""
+        if state.key is not None:
+            return state.key
+        return self.zobrist.hash(state.board.items(), state.to_move)
+
     def display(self, state):
         board = state.board
         for x in range(1, self.h + 1):
@@ -342,7 +1394,142 @@ class ConnectFour(TicTacToe):
 
     def __init__(self, h=7, v=6, k=4):
         TicTacToe.__init__(self, h, v, k)
+        # The columns nearest the centre lie on the most lines, so they are tried first:
+        self.column_order = sorted(range(1, h + 1), key=lambda x: abs(2 * x - h - 1))
 
     def actions(self, state):
         return [(x, y) for (x, y) in state.moves
                 if y == 1 or (x, y - 1) in state.board]
+
+    def iter_actions(self, state):
+        """The lowest free square of each column, centre columns first."""
+        board = state.board
+        for x in self.column_order:
+            for y in range(1, self.v + 1):
+                if (x, y) not in board:
+                    yield x, y
+                    break
+
+
+class BitboardTicTacToe(TicTacToe):
+    """TicTacToe with each player's squares held as the bits of an int, the
+    state being a BitboardState. Square (x, y) is bit (x - 1) * (v + 1) +
+    (y - 1), so each x is a column of v bits topped by an always-empty guard
+    bit, and a line of k in any direction is found by shifting a player's
+    bits by 1, v, v + 1 or v + 2 and masking, with no line wrapping around
+    between columns. Moves are (x, y) squares as in TicTacToe; use encode
+    and decode to convert to and from GameStates."""
+
+    def __init__(self, h=3, v=3, k=3):
+        TicTacToe.__init__(self, h, v, k)
+        self.bits = {(x, y): 1 << ((x - 1) * (v + 1) + (y - 1))
+                     for x in range(1, h + 1) for y in range(1, v + 1)}
+        self.squares = [(move, self.bits[move]) for move in self.initial.moves]
+        self.full = sum(self.bits.values())
+        # The shifts which narrow a player's bits down to the starts of lines of k in each direction; each
+        # doubles the length of the runs found, until the last which extends them to k:
+        self.line_shifts = []
+        for delta in (1, v, v + 1, v + 2):
+            shifts, n = [], 1
+            while 2 * n <= k:
+                shifts.append(n * delta)
+                n *= 2
+            if n < k:
+                shifts.append((k - n) * delta)
+            self.line_shifts.append(shifts)
+        self.initial = self.encode(self.initial)
+
+    def encode(self, state):
+        """Return the BitboardState of a TicTacToe GameState."""
+        x = sum(self.bits[square] for square, player in state.board.items() if player == 'X')
+        o = sum(self.bits[square] for square, player in state.board.items() if player == 'O')
+        return BitboardState(state.to_move, state.utility, x, o, None)
+
+    def decode(self, state):
+        """Return the TicTacToe GameState of a BitboardState."""
+        board = {square: 'X' if state.x & bit else 'O' for square, bit in self.squares if (state.x | state.o) & bit}
+        return GameState(to_move=state.to_move, utility=state.utility, board=board,
+                         moves=[square for square, bit in self.squares if not (state.x | state.o) & bit])
+
+    def actions(self, state):
+        occupied = state.x | state.o
+        return [square for square, bit in self.squares if not occupied & bit]
+
+    def iter_actions(self, state):
+        occupied = state.x | state.o
+        bits = self.bits
+        return (square for square in self.move_order if not occupied & bits[square])
+
+    def result(self, state, move):
+        if move not in self.bits or (state.x | state.o) & self.bits[move]:
+            return state  # Illegal move has no effect
+        return self.result_unchecked(state, move)
+
+    def result_unchecked(self, state, move):
+        bit = self.bits[move]
+        if state.to_move == 'X':
+            x = state.x | bit
+            return BitboardState('O', 1 if self.k_in_row_bits(x) else 0, x, state.o, None)
+        o = state.o | bit
+        return BitboardState('X', -1 if self.k_in_row_bits(o) else 0, state.x, o, None)
+
+    def terminal_test(self, state):
+        return state.utility != 0 or state.x | state.o == self.full
+
+    def state_key(self, state):
+        """Both players' bits, and so whose move it is, packed in one int."""
+        return state.x << (self.h * (self.v + 1)) | state.o
+
+    def k_in_row_bits(self, bits):
+        """Return true if the squares set in bits include a line of k."""
+        for shifts in self.line_shifts:
+            line = bits
+            for shift in shifts:
+                line &= line >> shift
+            if line:
+                return True
+        return False
+
+    def display(self, state):
+        TicTacToe.display(self, self.decode(state))
+
+
+class BitboardConnectFour(BitboardTicTacToe):
+    """ConnectFour on bitboards (see BitboardTicTacToe). The height of each
+    column is kept in the state, so the legal moves are read off it."""
+
+    def __init__(self, h=7, v=6, k=4):
+        self.columns = range(1, h + 1)
+        self.column_order = sorted(self.columns, key=lambda x: abs(2 * x - h - 1))
+        BitboardTicTacToe.__init__(self, h, v, k)
+
+    def encode(self, state):
+        bitboard = BitboardTicTacToe.encode(self, state)
+        heights = tuple(sum(1 for y in range(1, self.v + 1) if (x, y) in state.board) for x in self.columns)
+        return bitboard._replace(heights=heights)
+
+    def actions(self, state):
+        v = self.v
+        return [(x, height + 1) for x, height in zip(self.columns, state.heights) if height < v]
+
+    def iter_actions(self, state):
+        v, heights = self.v, state.heights
+        for x in self.column_order:
+            height = heights[x - 1]
+            if height < v:
+                yield x, height + 1
+
+    def result(self, state, move):
+        if move not in self.bits or move[1] != state.heights[move[0] - 1] + 1:
+            return state  # Illegal move has no effect
+        return self.result_unchecked(state, move)
+
+    def result_unchecked(self, state, move):
+        bit = self.bits[move]
+        heights = list(state.heights)
+        heights[move[0] - 1] += 1
+        if state.to_move == 'X':
+            x = state.x | bit
+            return BitboardState('O', 1 if self.k_in_row_bits(x) else 0, x, state.o, tuple(heights))
+        o = state.o | bit
+        return BitboardState('X', -1 if self.k_in_row_bits(o) else 0, state.x, o, tuple(heights))
@@ -1,3 +1,6 @@
+from array import array
+
+
 class Node:
 
     """A node in a search tree. Contains a pointer to the parent (the node
@@ -9,6 +12,10 @@ class Node:
     an explanation of how the f and h values are handled. You will not need to
     subclass this class."""
 
+    # No per-node __dict__; f and h are the slots that best-first searches
+    # memoize their evaluation functions in (see utils.memoize):
+    __slots__ = ('state', 'parent', 'action', 'path_cost', 'depth', 'f', 'h')
+
     def __init__(self, state, parent=None, action=None, path_cost=0):
         """Create a search tree Node, derived from a parent by an action."""
         self.state = state
@@ -47,7 +54,8 @@ class Node:
         while node:
             path_back.append(node)
             node = node.parent
-        return list(reversed(path_back))
+        path_back.reverse()
+        return path_back
 
     # We want for a queue of nodes in breadth_first_search or
     # astar_search to have no duplicated states, so we treat nodes
@@ -59,3 +67,51 @@ class Node:
 
     def __hash__(self):
         return hash(self.state)
+
+
+class NodeArray:
+
+    """The nodes of a search tree stored compactly, for searches over
+    millions of states: each node is an index, for which only the index of
+    its parent and its action are recorded, in arrays rather than as Python
+    objects. The root is node 0. Distinct actions are stored once, and each
+    node holds the index of its own. States are not stored; a node's path
+    is reconstructed on demand by replaying its actions from the initial
+    state of the problem (see node), so problem.result must be
+    deterministic."""
+
+    def __init__(self):
+        self.parents = array('q', [-1])
+        self.action_ids = array('l', [-1])
+        self.actions = []
+        self.action_ids_by_action = {}
+
+    def __len__(self):
+        return len(self.parents)
+
+    def add(self, parent, action):
+        """Record a child of node parent reached by action; return its index."""
+        action_id = self.action_ids_by_action.get(action)
+        if action_id is None:
+            action_id = self.action_ids_by_action[action] = len(self.actions)
+            self.actions.append(action)
+        self.parents.append(parent)
+        self.action_ids.append(action_id)
+        return len(self.parents) - 1
+
+    def solution(self, index):
+        """Return the sequence of actions to go from the root to node index."""
+        actions = []
+        while index > 0:
+            actions.append(self.actions[self.action_ids[index]])
+            index = self.parents[index]
+        actions.reverse()
+        return actions
+
+    def node(self, problem, index):
+        """Return node index as a Node, with the Nodes of its path as its
+        ancestors, by replaying its solution from problem.initial."""
+        node = Node(problem.initial)
+        for action in self.solution(index):
+            node = node.child_node(problem, action)
+        return node
@@ -3,6 +3,8 @@
 import bisect
 import collections
 import collections.abc
+import heapq
+import itertools
 import operator
 import os.path
 import random
@@ -734,42 +736,98 @@ class FIFOQueue(Queue):
         return item in self.queue
 
 
+class ReversedPriority:
+    """A priority which orders before another when it is the greater, so
+    that a min-heap of them returns the maximum first. Unlike negation this
+    works for any priority which supports <, such as a tuple."""
+
+    __slots__ = ('priority',)
+
+    def __init__(self, priority):
+        self.priority = priority
+
+    def __lt__(self, other):
+        return other.priority < self.priority
+
+    def __eq__(self, other):
+        return self.priority == other.priority
+
+    def __repr__(self):
+        return 'ReversedPriority({!r})'.format(self.priority)
+
+
 class PriorityQueue(Queue):
 
     """A queue in which the minimum (or maximum) element (as determined by f and
     order) is returned first. If order is min, the item with minimum f(x) is
     returned first; if order is max, then it is the item with maximum f(x).
-    Also supports dict-like lookup."""
+    Items with equal f(x) are returned in the order they were appended. Also
+    supports dict-like lookup; items must be hashable, and appending an item
+    equal to one already queued replaces it if it comes out sooner, and is
+    otherwise ignored (see decrease_key).
+    The queue is a binary heap of [priority, count, item] entries, with a
+    dict from each item to its entry for O(1) membership. Removed entries are
+    left in the heap, marked as such, and skipped when they reach the top.
+    f(x) need only support <, so with order max it is wrapped in a
+    ReversedPriority rather than negated."""
 
     def __init__(self, order=min, f=lambda x: x):
-        self.A = []
+        self.heap = []
+        self.entries = {}
         self.order = order
         self.f = f
+        self.count = itertools.count()  # Ties are broken by order of arrival
 
     def append(self, item):
-        bisect.insort(self.A, (self.f(item), item))
+        priority = self.f(item)
+        if self.order != min:
+            priority = ReversedPriority(priority)
+        if item in self.entries:
+            if not priority < self.entries[item][0]:
+                return
+            self.remove(item)
+        entry = [priority, next(self.count), item]
+        self.entries[item] = entry
+        heapq.heappush(self.heap, entry)
+
+    def decrease_key(self, item):
+        """Replace the queued item equal to item (e.g. a node with the same
+        state but a cheaper path) with item, at the priority f(item), if that
+        comes out sooner than the queued item's."""
+        self.append(item)
 
     def __len__(self):
-        return len(self.A)
+        return len(self.entries)
 
     def pop(self):
-        if self.order == min:
-            return self.A.pop(0)[1]
-        else:
-            return self.A.pop()[1]
+        while self.heap:
+            entry = heapq.heappop(self.heap)
+            if entry[-1] is not self.removed:
+                del self.entries[entry[-1]]
+                return entry[-1]
+        raise IndexError('pop from an empty PriorityQueue')
 
     def __contains__(self, item):
-        return any(item == pair[1] for pair in self.A)
+        return item in self.entries
 
     def __getitem__(self, key):
-        for _, item in self.A:
-            if item == key:
-                return item
+        entry = self.entries.get(key)
+        if entry is not None:
+            return entry[-1]
 
     def __delitem__(self, key):
-        for i, (value, item) in enumerate(self.A):
-            if item == key:
-                self.A.pop(i)
+        if key in self.entries:
+            self.remove(key)
+
+    removed = object()  # Marks the entries of items which have been removed
+
+    def remove(self, item):
+        """Remove the queued item equal to item, in O(1) time; the heap is
+        rebuilt without removed entries once they are most of it."""
+        self.entries.pop(item)[-1] = self.removed
+        if len(self.heap) > 2 * len(self.entries) + 32:
+            self.heap = [entry for entry in self.heap if entry[-1] is not self.removed]
+            heapq.heapify(self.heap)
 
 
 # ______________________________________________________________________________